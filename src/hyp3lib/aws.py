@@ -1,15 +1,81 @@
 """Tools for working with AWS"""
 
+import hashlib
+import io
 import logging
+import math
+import threading
 from mimetypes import guess_type
 from pathlib import Path
-from typing import Union
+from typing import Any, BinaryIO, List, Optional, Union
+from urllib.parse import urlencode
 
 import boto3
-from boto3.s3.transfer import TransferConfig
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from s3transfer.utils import ChunksizeAdjuster
 
 
-S3_CLIENT = boto3.client('s3')
+_S3_CLIENT = None
+_S3_CLIENT_KWARGS: dict = {}
+_S3_CLIENT_SESSION: Optional[boto3.session.Session] = None
+_S3_CLIENT_LOCK = threading.Lock()
+
+
+def configure_s3_client(
+    region_name: Optional[str] = None,
+    endpoint_url: Optional[str] = None,
+    max_pool_connections: Optional[int] = None,
+    session: Optional[boto3.session.Session] = None,
+) -> None:
+    """Configure the S3 client returned by `get_s3_client`, replacing any client that has already been created
+
+    Args:
+        region_name: AWS region of the client
+        endpoint_url: URL of the S3 endpoint, e.g. for an S3-compatible service
+        max_pool_connections: Maximum number of connections to keep in the client's connection pool
+        session: boto3 session to create the client from, instead of boto3's default session
+    """
+    global _S3_CLIENT, _S3_CLIENT_KWARGS, _S3_CLIENT_SESSION
+    kwargs: dict[str, Any] = {'region_name': region_name, 'endpoint_url': endpoint_url}
+    if max_pool_connections is not None:
+        kwargs['config'] = Config(max_pool_connections=max_pool_connections)
+    with _S3_CLIENT_LOCK:
+        _S3_CLIENT_KWARGS = kwargs
+        _S3_CLIENT_SESSION = session
+        _S3_CLIENT = None
+
+
+def get_s3_client():
+    """Get the shared S3 client, creating it on first use
+
+    Creating the client loads botocore's service models and resolves credentials, so it's deferred until the client is
+    needed rather than done when `hyp3lib.aws` is imported. The client is created from the session given to
+    `configure_s3_client`, or else from boto3's default session. A client assigned to `hyp3lib.aws.S3_CLIENT`, e.g. by
+    patching it in tests, takes precedence.
+    """
+    global _S3_CLIENT
+    # `S3_CLIENT` is only in the module namespace if it has been assigned; otherwise `__getattr__` provides it
+    assigned_client = globals().get('S3_CLIENT')
+    if assigned_client is not None:
+        return assigned_client
+
+    if _S3_CLIENT is None:
+        with _S3_CLIENT_LOCK:
+            if _S3_CLIENT is None:
+                if _S3_CLIENT_SESSION is not None:
+                    _S3_CLIENT = _S3_CLIENT_SESSION.client('s3', **_S3_CLIENT_KWARGS)
+                else:
+                    _S3_CLIENT = boto3.client('s3', **_S3_CLIENT_KWARGS)
+    return _S3_CLIENT
+
+
+def __getattr__(name: str):
+    # `S3_CLIENT` was created at import time in earlier versions
+    if name == 'S3_CLIENT':
+        return get_s3_client()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def get_tag_set(file_name: str) -> dict:
@@ -28,6 +94,12 @@ def get_tag_set(file_name: str) -> dict:
     return tag_set
 
 
+def get_tagging(file_name: str) -> str:
+    """Get the URL-encoded tags for a file, for use in the `Tagging` argument of an upload request"""
+    tag_set = get_tag_set(file_name)['TagSet']
+    return urlencode({tag['Key']: tag['Value'] for tag in tag_set})
+
+
 def get_content_type(file_location: Union[Path, str]) -> str:
     content_type = guess_type(file_location)[0]
     if not content_type:
@@ -35,14 +107,144 @@ def get_content_type(file_location: Union[Path, str]) -> str:
     return content_type
 
 
-def upload_file_to_s3(path_to_file: Path, bucket: str, prefix: str = '', chunk_size: int = 8_388_608):
+def get_local_etag(path_to_file: Path, chunk_size: int = 8_388_608) -> str:
+    """Compute the ETag S3 would give a file uploaded with a `TransferConfig` of the given chunk size
+
+    Files smaller than the chunk size are uploaded in one request and their ETag is the MD5 of the file. Larger files
+    are uploaded in parts and their ETag is the MD5 of the concatenated part MD5s followed by the number of parts.
+    """
+    size = path_to_file.stat().st_size
+    with open(path_to_file, 'rb') as f:
+        if size < chunk_size:
+            return f'"{hashlib.md5(f.read()).hexdigest()}"'
+
+        part_size = ChunksizeAdjuster().adjust_chunksize(chunk_size, size)
+        part_digests = [hashlib.md5(f.read(part_size)).digest() for _ in range(math.ceil(size / part_size))]
+    return f'"{hashlib.md5(b"".join(part_digests)).hexdigest()}-{len(part_digests)}"'
+
+
+def is_unchanged_in_s3(path_to_file: Path, bucket: str, key: str, chunk_size: int = 8_388_608) -> bool:
+    """Check whether an S3 object already has the content and content type of a local file
+
+    The content is compared by size and ETag, and the content type is compared with the one `upload_file_to_s3` would
+    set for the key.
+    """
+    try:
+        response = get_s3_client().head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            return False
+        raise
+    return (
+        response['ContentLength'] == path_to_file.stat().st_size
+        and response.get('ContentType') == get_content_type(key)
+        and response['ETag'] == get_local_etag(path_to_file, chunk_size)
+    )
+
+
+def _update_tags_in_s3(bucket: str, key: str, file_name: str) -> None:
+    """Re-apply the tags for a file to an existing S3 object if they differ, keeping any other tags on the object"""
+    s3_client = get_s3_client()
+    current_tags = {tag['Key']: tag['Value'] for tag in s3_client.get_object_tagging(Bucket=bucket, Key=key)['TagSet']}
+    expected_tags = {tag['Key']: tag['Value'] for tag in get_tag_set(file_name)['TagSet']}
+    if expected_tags.items() <= current_tags.items():
+        return
+
+    tags = {**current_tags, **expected_tags}
+    logging.info(f'Updating tags of s3://{bucket}/{key}')
+    s3_client.put_object_tagging(
+        Bucket=bucket, Key=key, Tagging={'TagSet': [{'Key': k, 'Value': v} for k, v in tags.items()]}
+    )
+
+
+def upload_file_to_s3(
+    path_to_file: Path, bucket: str, prefix: str = '', chunk_size: int = 8_388_608, skip_if_unchanged: bool = False
+):
     key = str(Path(prefix) / path_to_file.name)
+    if skip_if_unchanged and is_unchanged_in_s3(path_to_file, bucket, key, chunk_size):
+        logging.info(f'Skipping upload of s3://{bucket}/{key}; object is unchanged')
+        _update_tags_in_s3(bucket, key, path_to_file.name)
+        return
+
     extra_args = {'ContentType': get_content_type(key)}
     config = TransferConfig(multipart_threshold=chunk_size, multipart_chunksize=chunk_size)
 
+    s3_client = get_s3_client()
     logging.info(f'Uploading s3://{bucket}/{key}')
-    S3_CLIENT.upload_file(str(path_to_file), bucket, key, extra_args, Config=config)
+    s3_client.upload_file(str(path_to_file), bucket, key, extra_args, Config=config)
 
     tag_set = get_tag_set(path_to_file.name)
 
-    S3_CLIENT.put_object_tagging(Bucket=bucket, Key=key, Tagging=tag_set)
+    s3_client.put_object_tagging(Bucket=bucket, Key=key, Tagging=tag_set)
+
+
+def upload_fileobj_to_s3(fileobj: Union[BinaryIO, bytes], bucket: str, key: str, chunk_size: int = 8_388_608) -> None:
+    """Upload a file-like object or in-memory buffer to S3 without writing it to local disk
+
+    The content type and tags are determined from the key, as for `upload_file_to_s3`, and the tags are included in the
+    upload request. Objects larger than the chunk size are streamed as a multipart upload.
+
+    Args:
+        fileobj: Binary file-like object, or bytes, to upload
+        bucket: S3 bucket to upload to
+        key: S3 key to upload to
+        chunk_size: Multipart upload threshold and part size in bytes
+    """
+    if isinstance(fileobj, bytes):
+        fileobj = io.BytesIO(fileobj)
+    extra_args = {'ContentType': get_content_type(key), 'Tagging': get_tagging(Path(key).name)}
+    config = TransferConfig(multipart_threshold=chunk_size, multipart_chunksize=chunk_size)
+
+    logging.info(f'Uploading s3://{bucket}/{key}')
+    get_s3_client().upload_fileobj(fileobj, bucket, key, ExtraArgs=extra_args, Config=config)
+
+
+def upload_directory_to_s3(
+    directory: Union[Path, str],
+    bucket: str,
+    prefix: str = '',
+    chunk_size: int = 8_388_608,
+    max_concurrency: int = 10,
+    skip_if_unchanged: bool = False,
+) -> List[str]:
+    """Upload all files in a directory to S3 concurrently
+
+    Files are uploaded through a single shared transfer manager, and each file's tags are included in its upload
+    request rather than being set with a separate `put_object_tagging` call.
+
+    Args:
+        directory: Directory of files to upload; files in subdirectories are uploaded under their relative paths
+        bucket: S3 bucket to upload to
+        prefix: Key prefix for the uploaded files
+        chunk_size: Multipart upload threshold and part size in bytes
+        max_concurrency: Maximum number of concurrent upload requests
+        skip_if_unchanged: Don't upload files whose S3 object already has the same ETag and content type; the tags
+            of skipped objects are still updated if they differ
+
+    Returns:
+        The keys of the uploaded files, including any skipped because they were unchanged
+    """
+    directory = Path(directory)
+    config = TransferConfig(
+        multipart_threshold=chunk_size, multipart_chunksize=chunk_size, max_concurrency=max_concurrency
+    )
+
+    keys = []
+    with create_transfer_manager(get_s3_client(), config) as manager:
+        futures = []
+        for path_to_file in sorted(path for path in directory.rglob('*') if path.is_file()):
+            key = str(Path(prefix) / path_to_file.relative_to(directory))
+            keys.append(key)
+            if skip_if_unchanged and is_unchanged_in_s3(path_to_file, bucket, key, chunk_size):
+                logging.info(f'Skipping upload of s3://{bucket}/{key}; object is unchanged')
+                _update_tags_in_s3(bucket, key, path_to_file.name)
+                continue
+
+            extra_args = {'ContentType': get_content_type(key), 'Tagging': get_tagging(path_to_file.name)}
+            logging.info(f'Uploading s3://{bucket}/{key}')
+            futures.append(manager.upload(str(path_to_file), bucket, key, extra_args))
+
+        for future in futures:
+            future.result()
+
+    return keys
@@ -1,11 +1,32 @@
-from collections.abc import Generator
+import fcntl
+import json
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Generator, Iterable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache, partial
+from hashlib import sha256
+from itertools import repeat
 from pathlib import Path
-from tempfile import NamedTemporaryFile, TemporaryDirectory
+from tempfile import TemporaryDirectory, mkdtemp
+from typing import NamedTuple
+from xml.sax.saxutils import escape
 
-from osgeo import gdal, ogr
+import numpy as np
+import requests
+from osgeo import gdal, gdal_array, ogr
 
 from hyp3lib import DemError
-from hyp3lib.util import GDALConfigManager
+from hyp3lib.fetch import download_file, get_session
+from hyp3lib.util import GDALConfigManager, get_cache_dir
 
 
 DEM_GEOJSON = '/vsicurl/https://asf-dem-west.s3.amazonaws.com/v2/cop30_20250407.geojson'
@@ -15,57 +36,661 @@ gdal.UseExceptions()
 ogr.UseExceptions()
 
 
+def _get_local_dem_geojson() -> str:
+    """Get a local copy of `DEM_GEOJSON`, downloading it again only if its remote ETag or `Last-Modified` has changed
+
+    If the server sends neither, there's no way to tell whether the local copy is current, so it's downloaded again.
+    """
+    if not DEM_GEOJSON.startswith('/vsicurl/'):
+        return DEM_GEOJSON
+
+    url = DEM_GEOJSON.removeprefix('/vsicurl/')
+    cache_dir = get_cache_dir('dem')
+    local_file = cache_dir / Path(url).name
+    validator_file = cache_dir / f'{local_file.name}.validator'
+
+    try:
+        response = get_session().head(url, timeout=30)
+        response.raise_for_status()
+    except requests.RequestException:
+        if local_file.exists():
+            logging.warning(f'Unable to check {url} for updates; using cached copy {local_file}')
+            return str(local_file)
+        raise
+
+    validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+    if (
+        validator is not None
+        and local_file.exists()
+        and validator_file.exists()
+        and validator_file.read_text() == validator
+    ):
+        return str(local_file)
+
+    with TemporaryDirectory(dir=cache_dir) as temp_dir:
+        download_path = download_file(url, directory=temp_dir)
+        os.replace(download_path, local_file)
+    if validator is not None:
+        validator_file.write_text(validator)
+    else:
+        validator_file.unlink(missing_ok=True)
+
+    return str(local_file)
+
+
 def _get_dem_features() -> Generator[ogr.Feature, None, None]:
-    ds = ogr.Open(DEM_GEOJSON)
+    ds = ogr.Open(_get_local_dem_geojson())
     layer = ds.GetLayer()
     for feature in layer:
         yield feature
     del ds
 
 
+def _get_grid_cells(envelope: tuple[float, float, float, float]) -> Generator[tuple[int, int], None, None]:
+    minx, maxx, miny, maxy = envelope
+    for x in range(math.floor(minx), math.floor(maxx) + 1):
+        for y in range(math.floor(miny), math.floor(maxy) + 1):
+            yield x, y
+
+
+class _DemFootprintIndex:
+    """1-degree grid lookup of DEM tile footprints"""
+
+    def __init__(self, features: Iterable[ogr.Feature]):
+        self._footprints: list[tuple[str, ogr.Geometry]] = []
+        self._grid: dict[tuple[int, int], list[int]] = defaultdict(list)
+        for feature in features:
+            footprint = feature.GetGeometryRef().Clone()
+            for cell in _get_grid_cells(footprint.GetEnvelope()):
+                self._grid[cell].append(len(self._footprints))
+            self._footprints.append((feature.GetField('file_path'), footprint))
+
+    def query(self, geometry: ogr.Geometry) -> list[str]:
+        """Get the file paths of all DEM tiles intersecting a geometry, in catalog order"""
+        candidates = {index for cell in _get_grid_cells(geometry.GetEnvelope()) for index in self._grid.get(cell, [])}
+        file_paths = []
+        for index in sorted(candidates):
+            file_path, footprint = self._footprints[index]
+            if footprint.Intersects(geometry):
+                file_paths.append(file_path)
+        return file_paths
+
+
+@lru_cache
+def _get_dem_footprint_index(dem_geojson: str) -> _DemFootprintIndex:
+    logging.info(f'Building DEM footprint index for {dem_geojson}')
+    return _DemFootprintIndex(_get_dem_features())
+
+
 def _intersects_dem(geometry: ogr.Geometry) -> bool:
-    for feature in _get_dem_features():
-        if feature.GetGeometryRef().Intersects(geometry):
-            return True
-    return False
+    return len(_get_dem_footprint_index(DEM_GEOJSON).query(geometry)) > 0
 
 
 def _get_dem_file_paths(geometry: ogr.Geometry) -> list[str]:
-    file_paths = []
-    for feature in _get_dem_features():
-        if feature.GetGeometryRef().Intersects(geometry):
-            file_paths.append(feature.GetField('file_path'))
-    return file_paths
+    return _get_dem_footprint_index(DEM_GEOJSON).query(geometry)
+
+
+def _evict_least_recently_used(directory: Path, max_size_in_bytes: int, keep: Path) -> None:
+    with open(directory / '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        cached_files = [
+            (path.stat(), path)
+            for path in directory.iterdir()
+            if path.is_file() and path.name != '.lock' and path != keep
+        ]
+        total_size = keep.stat().st_size + sum(stat.st_size for stat, _ in cached_files)
+        for stat, path in sorted(cached_files, key=lambda cached_file: cached_file[0].st_mtime):
+            if total_size <= max_size_in_bytes:
+                break
+            path.unlink()
+            total_size -= stat.st_size
+
+
+def _link_tile(source: Path, link_path: Path) -> None:
+    """Hard-link a tile to a new path, copying it instead where hard links aren't supported"""
+    try:
+        os.link(source, link_path)
+    except FileExistsError:
+        pass
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(source, link_path)
+
+
+class DemTileCache:
+    """Content-addressed on-disk cache of DEM tiles
+
+    Tiles are stored under the SHA-256 hash of their source path and are evicted least-recently-used first once the
+    cache grows past its size cap. Tiles are written atomically and eviction is serialized with a lock file, so a cache
+    directory can be shared by several worker processes. Another process may evict a tile as soon as it is returned,
+    so callers that read tiles later should pass a `link_directory` to keep their own links to them.
+    """
+
+    def __init__(self, directory: Path | str, max_size_in_bytes: int = 100 * 2**30):
+        """
+        Args:
+            directory: Directory to store cached tiles in
+            max_size_in_bytes: Size cap for the cache; least recently used tiles are evicted past this size
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size_in_bytes = max_size_in_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._counter_lock = threading.Lock()
+
+    def _get_cache_path(self, file_path: str) -> Path:
+        return self.directory / f'{sha256(file_path.encode()).hexdigest()}{Path(file_path).suffix}'
+
+    def get(self, file_path: str, link_directory: Path | None = None) -> str:
+        """Get the local path of a DEM tile, fetching it into the cache on a miss
+
+        Args:
+            file_path: `/vsicurl/` path of the DEM tile; any other path is returned unchanged
+            link_directory: If provided, hard-link the tile into this directory and return the link, so the tile stays
+              readable even if it is evicted from the cache. Use a directory on the same file system as the cache,
+              such as a temporary directory inside it; tiles are copied if they can't be hard-linked.
+
+        Returns:
+            local_path: Path to the cached copy of the DEM tile, or to its link in `link_directory`
+        """
+        if not file_path.startswith('/vsicurl/'):
+            return file_path
+
+        cache_path = self._get_cache_path(file_path)
+        local_path = cache_path if link_directory is None else Path(link_directory) / cache_path.name
+        try:
+            os.utime(cache_path)
+            if link_directory is not None:
+                _link_tile(cache_path, local_path)
+            size = local_path.stat().st_size
+        except FileNotFoundError:
+            self._fetch(file_path, cache_path, local_path)
+            with self._counter_lock:
+                self.misses += 1
+        else:
+            with self._counter_lock:
+                self.hits += 1
+                self.bytes_saved += size
+        return str(local_path)
+
+    def get_many(
+        self, file_paths: Iterable[str], max_workers: int = 8, link_directory: Path | None = None
+    ) -> list[str]:
+        """Get the local paths of many DEM tiles, fetching any misses concurrently
+
+        Args:
+            file_paths: `/vsicurl/` paths of the DEM tiles; any other paths are returned unchanged
+            max_workers: Maximum number of tiles to fetch at once
+            link_directory: See `get`
+
+        Returns:
+            local_paths: Paths to the cached copies of the DEM tiles, in the order they were requested
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(partial(self.get, link_directory=link_directory), file_paths))
+
+    def _fetch(self, file_path: str, cache_path: Path, local_path: Path) -> None:
+        with TemporaryDirectory(dir=self.directory) as temp_dir:
+            download_path = Path(download_file(file_path.removeprefix('/vsicurl/'), directory=temp_dir))
+            # Link before publishing the tile, so it can't be evicted before the caller has its own link
+            if local_path != cache_path:
+                _link_tile(download_path, local_path)
+            os.replace(download_path, cache_path)
+        _evict_least_recently_used(self.directory, self.max_size_in_bytes, keep=cache_path)
+
+
+@lru_cache
+def _get_tile_cache(directory: str, max_size_in_bytes: int) -> DemTileCache:
+    return DemTileCache(directory, max_size_in_bytes)
+
+
+def _get_default_tile_cache() -> DemTileCache | None:
+    directory = os.environ.get('HYP3LIB_DEM_TILE_CACHE_DIR')
+    if not directory:
+        return None
+    max_size_in_gb = float(os.environ.get('HYP3LIB_DEM_TILE_CACHE_MAX_GB', 100))
+    return _get_tile_cache(directory, int(max_size_in_gb * 2**30))
+
+
+def _get_geoid_grid(wkt: str, bounds: list[float], width: int, height: int, directory: Path) -> Path:
+    """Get `GEOID` warped onto a grid in `directory`
 
+    If `HYP3LIB_GEOID_CACHE_DIR` is set, warped grids are cached there and hard-linked into `directory`, so a grid stays
+    readable even if another process evicts it from the cache.
+    """
+    key = sha256(json.dumps([wkt, bounds, width, height]).encode()).hexdigest()
+    local_file = Path(mkdtemp(dir=directory)) / f'{key}.tif'
+
+    def warp(destination: Path) -> None:
+        gdal.Warp(
+            str(destination),
+            GEOID,
+            dstSRS=wkt,
+            outputBounds=bounds,
+            width=width,
+            height=height,
+            resampleAlg='cubic',
+            multithread=True,
+            format='GTiff',
+            creationOptions=['COMPRESS=DEFLATE', 'PREDICTOR=3', 'TILED=YES'],
+        )
+
+    cache_dir = os.environ.get('HYP3LIB_GEOID_CACHE_DIR')
+    if not cache_dir:
+        warp(local_file)
+        return local_file
+
+    geoid_cache_dir = Path(cache_dir)
+    geoid_cache_dir.mkdir(parents=True, exist_ok=True)
+    geoid_file = geoid_cache_dir / local_file.name
+    try:
+        os.utime(geoid_file)
+        _link_tile(geoid_file, local_file)
+        return local_file
+    except FileNotFoundError:
+        pass
+
+    with TemporaryDirectory(dir=geoid_cache_dir) as temp_dir:
+        temp_file = Path(temp_dir) / geoid_file.name
+        warp(temp_file)
+        # Link before publishing the grid, so it can't be evicted before it's read
+        _link_tile(temp_file, local_file)
+        os.replace(temp_file, geoid_file)
 
-def _convert_to_height_above_ellipsoid(dem_file: Path) -> None:
+    max_size_in_gb = float(os.environ.get('HYP3LIB_GEOID_CACHE_MAX_GB', 10))
+    _evict_least_recently_used(geoid_cache_dir, int(max_size_in_gb * 2**30), keep=geoid_file)
+    return local_file
+
+
+def _iter_blocks(band: gdal.Band) -> Generator[tuple[int, int, int, int], None, None]:
+    block_width, block_height = band.GetBlockSize()
+    for yoff in range(0, band.YSize, block_height):
+        for xoff in range(0, band.XSize, block_width):
+            yield xoff, yoff, min(block_width, band.XSize - xoff), min(block_height, band.YSize - yoff)
+
+
+def _convert_to_height_above_ellipsoid(dem_file: Path, temp_dir: Path) -> None:
     dem_info = gdal.Info(str(dem_file), format='json')
     minx = dem_info['cornerCoordinates']['lowerLeft'][0]
     miny = dem_info['cornerCoordinates']['lowerLeft'][1]
     maxx = dem_info['cornerCoordinates']['upperRight'][0]
     maxy = dem_info['cornerCoordinates']['upperRight'][1]
-    with NamedTemporaryFile() as geoid_file:
-        gdal.Warp(
-            geoid_file.name,
-            GEOID,
-            dstSRS=dem_info['coordinateSystem']['wkt'],
+    width, height = dem_info['size']
+    geoid_file = _get_geoid_grid(dem_info['coordinateSystem']['wkt'], [minx, miny, maxx, maxy], width, height, temp_dir)
+
+    geoid_ds = gdal.Open(str(geoid_file))
+    geoid_band = geoid_ds.GetRasterBand(1)
+    dem_ds = gdal.Open(str(dem_file), gdal.GA_Update)
+    dem_band = dem_ds.GetRasterBand(1)
+
+    # Only full, right edge, bottom edge, and corner blocks differ in shape, so at most four buffer pairs are allocated
+    buffers: dict[tuple[int, int], tuple[np.ndarray, np.ndarray]] = {}
+    dem_dtype = gdal_array.GDALTypeCodeToNumericTypeCode(dem_band.DataType)
+    geoid_dtype = gdal_array.GDALTypeCodeToNumericTypeCode(geoid_band.DataType)
+    for xoff, yoff, xsize, ysize in _iter_blocks(dem_band):
+        if (ysize, xsize) not in buffers:
+            buffers[(ysize, xsize)] = (
+                np.empty((ysize, xsize), dtype=dem_dtype),
+                np.empty((ysize, xsize), dtype=geoid_dtype),
+            )
+        dem_data, geoid_data = buffers[(ysize, xsize)]
+        dem_band.ReadAsArray(xoff, yoff, xsize, ysize, buf_obj=dem_data)
+        geoid_band.ReadAsArray(xoff, yoff, xsize, ysize, buf_obj=geoid_data)
+        dem_data += geoid_data
+        dem_band.WriteArray(dem_data, xoff, yoff)
+
+    dem_ds.FlushCache()
+    del dem_ds
+    del geoid_ds
+
+
+def _build_height_above_ellipsoid_vrt(warped_vrt: Path) -> Path:
+    """Build a VRT that adds the geoid to a warped DEM with a pixel function, so it's applied as the DEM is written"""
+    dem_info = gdal.Info(str(warped_vrt), format='json')
+    minx = dem_info['cornerCoordinates']['lowerLeft'][0]
+    miny = dem_info['cornerCoordinates']['lowerLeft'][1]
+    maxx = dem_info['cornerCoordinates']['upperRight'][0]
+    maxy = dem_info['cornerCoordinates']['upperRight'][1]
+    width, height = dem_info['size']
+    # The VRT reads the geoid grid when the DEM is translated, so keep it next to the VRT until then
+    geoid_file = _get_geoid_grid(
+        dem_info['coordinateSystem']['wkt'], [minx, miny, maxx, maxy], width, height, warped_vrt.parent
+    )
+
+    warped_ds = gdal.Open(str(warped_vrt))
+    warped_band = warped_ds.GetRasterBand(1)
+    sum_vrt = warped_vrt.with_name(f'{warped_vrt.stem}_ellipsoid.vrt')
+    sources = ''.join(
+        f'<SimpleSource><SourceFilename relativeToVRT="0">{escape(str(source))}</SourceFilename>'
+        f'<SourceBand>1</SourceBand></SimpleSource>'
+        for source in (warped_vrt, geoid_file)
+    )
+    sum_vrt.write_text(
+        f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">'
+        f'<SRS>{escape(warped_ds.GetProjection())}</SRS>'
+        f'<GeoTransform>{", ".join(repr(value) for value in warped_ds.GetGeoTransform())}</GeoTransform>'
+        f'<VRTRasterBand dataType="{gdal.GetDataTypeName(warped_band.DataType)}" band="1" '
+        f'subClass="VRTDerivedRasterBand"><PixelFunctionType>sum</PixelFunctionType>{sources}</VRTRasterBand>'
+        f'</VRTDataset>'
+    )
+
+    sum_ds = gdal.Open(str(sum_vrt), gdal.GA_Update)
+    sum_ds.SetMetadata(warped_ds.GetMetadata())
+    nodata = warped_band.GetNoDataValue()
+    if nodata is not None:
+        sum_ds.GetRasterBand(1).SetNoDataValue(nodata)
+    sum_ds = None
+    del warped_ds
+
+    return sum_vrt
+
+
+class CogOptions(NamedTuple):
+    """Layout of Cloud Optimized GeoTIFF DEM mosaics"""
+
+    block_size: int = 512
+    compression: str = 'DEFLATE'
+    overviews: bool = False
+
+
+def _translate_dem(output_name: Path, dem_vrt: Path, cog: CogOptions | None) -> None:
+    if cog is None:
+        gdal.Translate(str(output_name), str(dem_vrt), format='GTiff')
+        return
+
+    creation_options = [
+        f'BLOCKSIZE={cog.block_size}',
+        f'COMPRESS={cog.compression}',
+        f'OVERVIEWS={"AUTO" if cog.overviews else "NONE"}',
+        'NUM_THREADS=ALL_CPUS',
+    ]
+    # PREDICTOR=YES picks the floating point or horizontal differencing predictor to match the data type
+    if cog.compression.upper() in ('DEFLATE', 'LZW', 'ZSTD'):
+        creation_options.append('PREDICTOR=YES')
+    gdal.Translate(str(output_name), str(dem_vrt), format='COG', creationOptions=creation_options)
+
+
+class DemRequest(NamedTuple):
+    """A DEM mosaic GeoTIFF to prepare with `prepare_dem_geotiffs`"""
+
+    output_name: Path
+    geometry: ogr.Geometry
+    epsg_code: int
+    pixel_size: float
+
+
+def _get_buffered_geometry(
+    geometry: ogr.Geometry, buffer_size_in_degrees: float, height_above_ellipsoid: bool
+) -> ogr.Geometry:
+    if geometry.GetGeometryName() != 'POLYGON':
+        raise DemError(f'{geometry.GetGeometryName()} geometry is invalid; only POLYGON is supported.')
+
+    buffered_geometry = geometry.Buffer(buffer_size_in_degrees)
+    minx, maxx, miny, maxy = buffered_geometry.GetEnvelope()
+    if not (-200 <= minx <= maxx <= 200):
+        raise DemError(f'Extent of buffered geometry ({minx} - {maxx}) is not between -200 and +200 degrees longitude.')
+
+    if not (-180 <= minx <= maxx <= 180) and height_above_ellipsoid:
+        raise DemError(
+            'height_above_ellipsoid is not supported for buffered geometries with coordinates outside -180 to +180 degrees longitude.'
+        )
+
+    if not _intersects_dem(geometry):
+        raise DemError(f'Copernicus GLO-30 Public DEM does not intersect this geometry: {geometry}')
+
+    return buffered_geometry
+
+
+def _build_dem_vrt(dem_vrt: Path, dem_file_paths: list[str]) -> None:
+    gdal.BuildVRT(str(dem_vrt), dem_file_paths)
+    # This is required to ensure the VRT is treated as a point dataset
+    vrt_ds = gdal.Open(str(dem_vrt), gdal.GA_Update)
+    vrt_ds.SetMetadataItem('AREA_OR_POINT', 'Point')
+    vrt_ds = None
+
+
+def _warp_dem(
+    output_name: Path,
+    dem_vrt: Path,
+    buffered_geometry: ogr.Geometry,
+    epsg_code: int,
+    pixel_size: float,
+    output_format: str = 'GTiff',
+    warp_memory_limit: float | None = None,
+) -> None:
+    minx, maxx, miny, maxy = buffered_geometry.GetEnvelope()
+    gdal.Warp(
+        str(output_name),
+        str(dem_vrt),
+        dstSRS=f'EPSG:{epsg_code}',
+        outputBoundsSRS='EPSG:4326',
+        outputBounds=[minx, miny, maxx, maxy],
+        xRes=pixel_size,
+        yRes=pixel_size,
+        targetAlignedPixels=True,
+        resampleAlg='cubic',
+        multithread=True,
+        warpMemoryLimit=warp_memory_limit,
+        format=output_format,
+    )
+
+
+def _warp_chunk(
+    dem_vrt: str,
+    wkt: str,
+    geotransform: tuple[float, ...],
+    window: tuple[int, int, int, int],
+    halo: int,
+    warp_memory_limit: float | None,
+) -> np.ndarray:
+    xoff, yoff, xsize, ysize = window
+    minx = geotransform[0] + (xoff - halo) * geotransform[1]
+    maxx = geotransform[0] + (xoff + xsize + halo) * geotransform[1]
+    maxy = geotransform[3] + (yoff - halo) * geotransform[5]
+    miny = geotransform[3] + (yoff + ysize + halo) * geotransform[5]
+    with GDALConfigManager(GDAL_DISABLE_READDIR_ON_OPEN='EMPTY_DIR'):
+        chunk_ds = gdal.Warp(
+            '',
+            dem_vrt,
+            dstSRS=wkt,
             outputBounds=[minx, miny, maxx, maxy],
-            width=dem_info['size'][0],
-            height=dem_info['size'][1],
+            width=xsize + 2 * halo,
+            height=ysize + 2 * halo,
             resampleAlg='cubic',
-            multithread=True,
-            format='GTiff',
+            warpMemoryLimit=warp_memory_limit,
+            format='MEM',
         )
-        geoid_ds = gdal.Open(geoid_file.name)
-        geoid_data = geoid_ds.GetRasterBand(1).ReadAsArray()
-        del geoid_ds
+    return chunk_ds.GetRasterBand(1).ReadAsArray(halo, halo, xsize, ysize)
 
-        dem_ds = gdal.Open(str(dem_file), gdal.GA_Update)
-        dem_data = dem_ds.GetRasterBand(1).ReadAsArray()
-        dem_data += geoid_data
-        dem_ds.GetRasterBand(1).WriteArray(dem_data)
-        dem_ds.FlushCache()
-        del dem_ds
+
+def _get_chunk_executor(max_workers: int | None = None) -> ProcessPoolExecutor:
+    # GDAL isn't fork-safe while other threads hold datasets open, so start the workers fresh
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def _warp_dem_in_chunks(
+    output_name: Path,
+    dem_vrt: Path,
+    buffered_geometry: ogr.Geometry,
+    epsg_code: int,
+    pixel_size: float,
+    chunk_size: int,
+    halo: int = 16,
+    warp_memory_limit: float | None = None,
+    executor: ProcessPoolExecutor | None = None,
+) -> None:
+    """Warp a DEM mosaic in aligned, halo-padded chunks in a process pool and assemble them into one GeoTIFF
+
+    Chunks are warped in `executor` if provided, so several mosaics can share one bounded pool, or else in a new pool
+    with a worker per CPU.
+    """
+    grid_vrt = dem_vrt.with_name(f'{dem_vrt.stem}_grid.vrt')
+    _warp_dem(grid_vrt, dem_vrt, buffered_geometry, epsg_code, pixel_size, output_format='VRT')
+    grid_ds = gdal.Open(str(grid_vrt))
+    grid_band = grid_ds.GetRasterBand(1)
+    width, height = grid_ds.RasterXSize, grid_ds.RasterYSize
+    geotransform = grid_ds.GetGeoTransform()
+    wkt = grid_ds.GetProjection()
+
+    output_ds = gdal.GetDriverByName('GTiff').Create(str(output_name), width, height, 1, grid_band.DataType)
+    output_ds.SetGeoTransform(geotransform)
+    output_ds.SetProjection(wkt)
+    output_ds.SetMetadata(grid_ds.GetMetadata())
+    output_band = output_ds.GetRasterBand(1)
+    nodata = grid_band.GetNoDataValue()
+    if nodata is not None:
+        output_band.SetNoDataValue(nodata)
+    del grid_ds
+
+    windows = [
+        (xoff, yoff, min(chunk_size, width - xoff), min(chunk_size, height - yoff))
+        for yoff in range(0, height, chunk_size)
+        for xoff in range(0, width, chunk_size)
+    ]
+    with ExitStack() as stack:
+        if executor is None:
+            executor = stack.enter_context(_get_chunk_executor())
+        chunks = executor.map(
+            _warp_chunk,
+            repeat(str(dem_vrt)),
+            repeat(wkt),
+            repeat(geotransform),
+            windows,
+            repeat(halo),
+            repeat(warp_memory_limit),
+        )
+        for (xoff, yoff, _, _), chunk in zip(windows, chunks):
+            output_band.WriteArray(chunk, xoff, yoff)
+
+    output_ds.FlushCache()
+    del output_ds
+
+
+def prepare_dem_geotiffs(
+    dem_requests: Iterable[tuple[Path, ogr.Geometry, int, float]],
+    buffer_size_in_degrees: float = 0.0,
+    height_above_ellipsoid: bool = False,
+    tile_cache: DemTileCache | None = None,
+    max_workers: int | None = None,
+    single_pass: bool = False,
+    cog: CogOptions | None = None,
+    warp_memory_limit: float | None = None,
+    chunk_size: int | None = None,
+    chunk_workers: int | None = None,
+    prefetch_tiles: bool | None = None,
+    prefetch_workers: int = 8,
+) -> list[Path]:
+    """Create DEM mosaic GeoTIFFs covering many, possibly overlapping, geometries.
+
+    The DEM tiles needed by all of the requests are looked up and fetched once, through the tile cache or into a
+    scratch directory, then the mosaics are warped in parallel. Each output GeoTIFF is identical to the one `prepare_dem_geotiff` produces for the same
+    request.
+
+    Args:
+        dem_requests: `(output_name, geometry, epsg_code, pixel_size)` for each DEM mosaic; see `prepare_dem_geotiff`
+        buffer_size_in_degrees: Extent of each output geotiff will be the extent of its buffered input geometry.
+        height_above_ellipsoid: See `prepare_dem_geotiff`
+        tile_cache: See `prepare_dem_geotiff`
+        max_workers: Maximum number of DEM mosaics to warp at once
+        single_pass: See `prepare_dem_geotiff`
+        cog: See `prepare_dem_geotiff`
+        warp_memory_limit: See `prepare_dem_geotiff`
+        chunk_size: See `prepare_dem_geotiff`
+        chunk_workers: See `prepare_dem_geotiff`. One pool of chunk workers is shared by all of the requests, so at
+          most this many chunks are warped at once however many mosaics are warped in parallel.
+        prefetch_tiles: See `prepare_dem_geotiff`. Defaults to True if there is more than one request, so that tiles
+          shared by several requests are only downloaded once.
+        prefetch_workers: See `prepare_dem_geotiff`
+
+    Returns:
+        output_names: Paths of the output GeoTIFFs, in the order they were requested
+    """
+    requests_to_prepare = [DemRequest(*dem_request) for dem_request in dem_requests]
+    buffered_geometries = [
+        _get_buffered_geometry(dem_request.geometry, buffer_size_in_degrees, height_above_ellipsoid)
+        for dem_request in requests_to_prepare
+    ]
+
+    if tile_cache is None:
+        tile_cache = _get_default_tile_cache()
+    if prefetch_tiles is None:
+        prefetch_tiles = len(requests_to_prepare) > 1
+
+    with GDALConfigManager(GDAL_DISABLE_READDIR_ON_OPEN='EMPTY_DIR'):
+        with TemporaryDirectory() as temp_dir, ExitStack() as stack:
+            temp_path = Path(temp_dir)
+            request_file_paths = [_get_dem_file_paths(buffered_geometry) for buffered_geometry in buffered_geometries]
+
+            local_paths = {file_path: file_path for file_paths in request_file_paths for file_path in file_paths}
+            link_directory = None
+            if tile_cache is None and prefetch_tiles:
+                tile_cache = DemTileCache(temp_path / 'tiles', max_size_in_bytes=sys.maxsize)
+            elif tile_cache is not None:
+                # Keep links to the tiles until the warps finish, in case another process evicts them from the cache
+                link_directory = Path(stack.enter_context(TemporaryDirectory(dir=tile_cache.directory)))
+            if tile_cache is not None:
+                start_time = time.perf_counter()
+                tiles = tile_cache.get_many(local_paths, max_workers=prefetch_workers, link_directory=link_directory)
+                local_paths = dict(zip(local_paths, tiles))
+                logging.info(f'Fetched {len(local_paths)} DEM tiles in {time.perf_counter() - start_time:.1f} s')
+                logging.info(
+                    f'DEM tile cache: {tile_cache.hits} hits, {tile_cache.misses} misses, '
+                    f'{tile_cache.bytes_saved} bytes saved'
+                )
+
+            chunk_executor = None
+            if chunk_size is not None:
+                chunk_executor = stack.enter_context(_get_chunk_executor(chunk_workers))
+
+            def prepare(index: int) -> Path:
+                dem_request = requests_to_prepare[index]
+                dem_vrt = temp_path / f'dem_{index}.vrt'
+                _build_dem_vrt(dem_vrt, [local_paths[file_path] for file_path in request_file_paths[index]])
+                if cog is None and not (height_above_ellipsoid and single_pass):
+                    if chunk_size is not None:
+                        _warp_dem_in_chunks(
+                            dem_request.output_name,
+                            dem_vrt,
+                            buffered_geometries[index],
+                            dem_request.epsg_code,
+                            dem_request.pixel_size,
+                            chunk_size,
+                            warp_memory_limit=warp_memory_limit,
+                            executor=chunk_executor,
+                        )
+                    else:
+                        _warp_dem(
+                            dem_request.output_name,
+                            dem_vrt,
+                            buffered_geometries[index],
+                            dem_request.epsg_code,
+                            dem_request.pixel_size,
+                            warp_memory_limit=warp_memory_limit,
+                        )
+                    if height_above_ellipsoid:
+                        _convert_to_height_above_ellipsoid(dem_request.output_name, temp_path)
+                    return dem_request.output_name
+
+                warped_vrt = temp_path / f'dem_{index}_warped.vrt'
+                _warp_dem(
+                    warped_vrt,
+                    dem_vrt,
+                    buffered_geometries[index],
+                    dem_request.epsg_code,
+                    dem_request.pixel_size,
+                    output_format='VRT',
+                    warp_memory_limit=warp_memory_limit,
+                )
+                if height_above_ellipsoid:
+                    warped_vrt = _build_height_above_ellipsoid_vrt(warped_vrt)
+                _translate_dem(dem_request.output_name, warped_vrt, cog)
+                return dem_request.output_name
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return list(executor.map(prepare, range(len(requests_to_prepare))))
 
 
 def prepare_dem_geotiff(
@@ -75,6 +700,14 @@ def prepare_dem_geotiff(
     pixel_size: float,
     buffer_size_in_degrees: float = 0.0,
     height_above_ellipsoid: bool = False,
+    tile_cache: DemTileCache | None = None,
+    single_pass: bool = False,
+    cog: CogOptions | None = None,
+    warp_memory_limit: float | None = None,
+    chunk_size: int | None = None,
+    chunk_workers: int | None = None,
+    prefetch_tiles: bool = False,
+    prefetch_workers: int = 8,
 ) -> Path:
     """Create a DEM mosaic GeoTIFF covering a given geometry.
 
@@ -92,49 +725,32 @@ def prepare_dem_geotiff(
           If False, output pixel values will be meters above mean sea level.
           If True, the output pixel values will be meters above the ellipsoid.
           Only supported for geometries between -180 and +180 degrees longitude (i.e. geometries not crossing the antimeridian).
+        tile_cache: On-disk cache to read DEM tiles through. Defaults to a cache in the `HYP3LIB_DEM_TILE_CACHE_DIR`
+          directory, capped at `HYP3LIB_DEM_TILE_CACHE_MAX_GB` gigabytes, if that environment variable is set.
+        single_pass: If True and `height_above_ellipsoid` is True, add the geoid while warping so the output GeoTIFF is
+          written once, rather than writing it and then updating every pixel in place.
+        cog: If provided, write a tiled, compressed Cloud Optimized GeoTIFF with this layout instead of a striped,
+          uncompressed GeoTIFF. The geoid is always added in a single pass for COG output.
+        warp_memory_limit: Memory for GDAL's warp operation to use; values < 10000 are in MB, otherwise in bytes
+        chunk_size: If provided, split the output grid into aligned chunks of this many pixels on a side and warp them
+          in parallel in a process pool. Only used for uncompressed GeoTIFF output without `single_pass`.
+        chunk_workers: Maximum number of processes to warp chunks in; defaults to the number of CPUs
+        prefetch_tiles: If True, download all of the DEM tiles to a scratch directory before warping rather than
+          reading them over `/vsicurl/` during the warp. Tiles are always fetched ahead of the warp when a
+          `tile_cache` is in use.
+        prefetch_workers: Maximum number of DEM tiles to download at once
     """
-    if geometry.GetGeometryName() != 'POLYGON':
-        raise DemError(f'{geometry.GetGeometryName()} geometry is invalid; only POLYGON is supported.')
-
-    buffered_geometry = geometry.Buffer(buffer_size_in_degrees)
-    minx, maxx, miny, maxy = buffered_geometry.GetEnvelope()
-    if not (-200 <= minx <= maxx <= 200):
-        raise DemError(f'Extent of buffered geometry ({minx} - {maxx}) is not between -200 and +200 degrees longitude.')
-
-    if not (-180 <= minx <= maxx <= 180) and height_above_ellipsoid:
-        raise DemError(
-            'height_above_ellipsoid is not supported for buffered geometries with coordinates outside -180 to +180 degrees longitude.'
-        )
-
-    if not _intersects_dem(geometry):
-        raise DemError(f'Copernicus GLO-30 Public DEM does not intersect this geometry: {geometry}')
-
-    with GDALConfigManager(GDAL_DISABLE_READDIR_ON_OPEN='EMPTY_DIR'):
-        with TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            dem_file_paths = _get_dem_file_paths(buffered_geometry)
-
-            dem_vrt = temp_path / 'dem.vrt'
-            gdal.BuildVRT(str(dem_vrt), dem_file_paths)
-            # This is required to ensure the VRT is treated as a point dataset
-            vrt_ds = gdal.Open(str(dem_vrt), gdal.GA_Update)
-            vrt_ds.SetMetadataItem('AREA_OR_POINT', 'Point')
-            vrt_ds = None
-            gdal.Warp(
-                str(output_name),
-                str(dem_vrt),
-                dstSRS=f'EPSG:{epsg_code}',
-                outputBoundsSRS='EPSG:4326',
-                outputBounds=[minx, miny, maxx, maxy],
-                xRes=pixel_size,
-                yRes=pixel_size,
-                targetAlignedPixels=True,
-                resampleAlg='cubic',
-                multithread=True,
-                format='GTiff',
-            )
-
-    if height_above_ellipsoid:
-        _convert_to_height_above_ellipsoid(output_name)
-
+    [output_name] = prepare_dem_geotiffs(
+        [(output_name, geometry, epsg_code, pixel_size)],
+        buffer_size_in_degrees=buffer_size_in_degrees,
+        height_above_ellipsoid=height_above_ellipsoid,
+        tile_cache=tile_cache,
+        single_pass=single_pass,
+        cog=cog,
+        warp_memory_limit=warp_memory_limit,
+        chunk_size=chunk_size,
+        chunk_workers=chunk_workers,
+        prefetch_tiles=prefetch_tiles,
+        prefetch_workers=prefetch_workers,
+    )
     return output_name
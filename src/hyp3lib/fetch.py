@@ -1,10 +1,20 @@
 """Utilities for fetching things from external endpoints"""
 
+import base64
+import hashlib
+import http.cookiejar
+import importlib
 import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from email.message import Message
+from functools import partial
 from os.path import basename
 from pathlib import Path
-from typing import Optional, Tuple, Union
+from typing import Callable, Iterable, NamedTuple, Optional, Tuple, Union
 from urllib.parse import urlparse
 
 import requests
@@ -14,6 +24,64 @@ from urllib3.util.retry import Retry
 
 EARTHDATA_LOGIN_DOMAIN = 'urs.earthdata.nasa.gov'
 
+# Small chunks from the network are merged into writes of this size
+WRITE_BUFFER_SIZE = 4 * 2**20
+
+_SESSIONS: dict[Tuple[int, float], requests.Session] = {}
+_SESSIONS_LOCK = threading.Lock()
+_POOL_SIZES = {'pool_connections': 10, 'pool_maxsize': 10}
+
+
+def configure_session_pool(pool_connections: int = 10, pool_maxsize: int = 10) -> None:
+    """Configure the connection pools of the shared HTTP sessions returned by `get_session`
+
+    Any existing shared sessions are closed and will be recreated with the new pool sizes on next use.
+
+    Args:
+        pool_connections: Number of hosts to keep a pool of connections open to
+        pool_maxsize: Maximum number of connections to keep open to each host
+    """
+    with _SESSIONS_LOCK:
+        _POOL_SIZES.update(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
+
+
+def get_session(retries: int = 2, backoff_factor: float = 1) -> requests.Session:
+    """Get the process-wide HTTP session for a retry policy
+
+    Sessions are shared so that connections to each host are kept alive and reused between requests. Authentication
+    should be passed with each request rather than set on the shared session. The shared sessions never store cookies,
+    so cookies set while following one request's redirects, such as by an Earthdata Login, are not sent with any other
+    request.
+
+    Args:
+        retries: Number of retries to attempt
+        backoff_factor: Factor for calculating time between retries
+
+    Returns:
+        session: The shared session
+    """
+    with _SESSIONS_LOCK:
+        if (retries, backoff_factor) not in _SESSIONS:
+            retry_strategy = Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=[429, 500, 502, 503, 504],
+            )
+            session = requests.Session()
+            session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+            for prefix in ('https://', 'http://'):
+                adapter = HTTPAdapter(
+                    pool_connections=_POOL_SIZES['pool_connections'],
+                    pool_maxsize=_POOL_SIZES['pool_maxsize'],
+                    max_retries=retry_strategy,
+                )
+                session.mount(prefix, adapter)
+            _SESSIONS[(retries, backoff_factor)] = session
+        return _SESSIONS[(retries, backoff_factor)]
+
 
 def write_credentials_to_netrc_file(
     username: str, password: str, domain: str = EARTHDATA_LOGIN_DOMAIN, append: bool = False
@@ -41,6 +109,331 @@ def _get_download_path(url: str, content_disposition: str | None = None, directo
     return Path(directory) / filename
 
 
+class DownloadStats(NamedTuple):
+    """Instrumentation for a single download"""
+
+    url: str
+    bytes_downloaded: int
+    elapsed_time: float
+    time_to_first_byte: Optional[float]
+    retries: int
+    write_stall_time: float
+
+    @property
+    def throughput(self) -> float:
+        """Bytes downloaded per second"""
+        return self.bytes_downloaded / self.elapsed_time if self.elapsed_time else 0.0
+
+
+def _get_part_path(download_path: Path) -> Path:
+    return download_path.with_name(f'{download_path.name}.part')
+
+
+def _get_validator_path(part_path: Path) -> Path:
+    return part_path.with_name(f'{part_path.name}.validator')
+
+
+def _get_validator(headers) -> Optional[str]:
+    """Get a validator for the `If-Range` header, which must be a strong ETag or a `Last-Modified` date"""
+    etag = headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('last-modified')
+
+
+def _discard_part_file(part_path: Path) -> None:
+    part_path.unlink(missing_ok=True)
+    _get_validator_path(part_path).unlink(missing_ok=True)
+
+
+def _get_total_size(response: requests.Response, offset: int) -> Optional[int]:
+    if 'content-encoding' in response.headers:
+        return None
+    content_range = response.headers.get('content-range')
+    if content_range is not None and not content_range.endswith('/*'):
+        return int(content_range.rsplit('/', 1)[1])
+    content_length = response.headers.get('content-length')
+    if content_length is not None:
+        return offset + int(content_length)
+    return None
+
+
+def _download_with_resume(
+    session: requests.Session,
+    url: str,
+    directory: Union[Path, str],
+    chunk_size,
+    retries: int,
+    backoff_factor: float,
+    auth: Optional[Tuple[str, str]],
+    headers: dict,
+    checksum_algorithm: Optional[str] = None,
+    stats_callback: Optional[Callable[[DownloadStats], None]] = None,
+) -> Tuple[Path, Optional[str], Optional[str]]:
+    """Stream a file to a `.part` file, resuming with a range request after a dropped connection or a restart
+
+    The ETag or `Last-Modified` date of the file is saved next to the `.part` file and sent as `If-Range` when
+    resuming, so a `.part` file is only resumed if it belongs to the same version of the file. A `.part` file without
+    a saved validator, one for a different version of the file, or one the server rejects with a 416 response, is
+    discarded and the download starts over.
+
+    The `.part` file is renamed into place once it has been verified against the size reported by the server. If a
+    checksum algorithm is given, the file is hashed as it's written. If a stats callback is given, it's called with
+    the `DownloadStats` of the download once it's complete.
+
+    Returns:
+        download_path: The path to the downloaded file
+        checksum: Hex digest of the downloaded file, if a checksum algorithm was given
+        server_checksum: Hex digest of the file reported by the server's response headers, if any
+    """
+    download_path: Optional[Path] = None
+    part_path: Optional[Path] = None
+    validator: Optional[str] = None
+    hasher = _new_hasher(checksum_algorithm) if checksum_algorithm else None
+    server_checksum = None
+    offset = 0
+    resumes = 0
+    retries_taken = 0
+    bytes_downloaded = 0
+    time_to_first_byte = None
+    write_stall_time = 0.0
+    start_time = time.perf_counter()
+    while True:
+        range_headers = {'Range': f'bytes={offset}-', 'If-Range': validator} if offset and validator else {}
+        try:
+            with session.get(url, stream=True, auth=auth, headers={**headers, **range_headers}) as s:
+                if download_path is None:
+                    download_path = _get_download_path(s.url, s.headers.get('content-disposition'), directory)
+                    part_path = _get_part_path(download_path)
+                assert part_path is not None
+                validator_path = _get_validator_path(part_path)
+                if s.raw.retries is not None:
+                    retries_taken += len(s.raw.retries.history)
+
+                if s.status_code == 416 and range_headers:
+                    logging.warning(f'Server rejected resuming {url} from byte {offset}; starting over')
+                    _discard_part_file(part_path)
+                    offset = 0
+                    continue
+                s.raise_for_status()
+
+                if s.status_code == 206 and (
+                    not s.headers.get('content-range', '').startswith(f'bytes {offset}-')
+                    or _get_validator(s.headers) not in (None, validator)
+                ):
+                    logging.warning(f'Unexpected range response resuming {url} from byte {offset}; starting over')
+                    _discard_part_file(part_path)
+                    offset = 0
+                    continue
+
+                if offset == 0 and part_path.exists():
+                    saved_validator = validator_path.read_text() if validator_path.exists() else None
+                    if (
+                        'content-encoding' in s.headers
+                        or saved_validator is None
+                        or saved_validator != _get_validator(s.headers)
+                    ):
+                        logging.info(f'Discarding {part_path}, which may not belong to {url}')
+                        _discard_part_file(part_path)
+                    elif part_path.stat().st_size > 0:
+                        offset = part_path.stat().st_size
+                        validator = saved_validator
+                        logging.info(f'Resuming download of {url} from byte {offset}')
+                        if hasher is not None:
+                            _hash_file(hasher, part_path)
+                        continue
+
+                total_size = _get_total_size(s, offset)
+                if s.status_code != 206:
+                    offset = 0
+                    validator = _get_validator(s.headers) if 'content-encoding' not in s.headers else None
+                    if validator is not None:
+                        validator_path.write_text(validator)
+                    else:
+                        validator_path.unlink(missing_ok=True)
+                    if checksum_algorithm:
+                        hasher = _new_hasher(checksum_algorithm)
+                        server_checksum = _get_server_checksum(s.headers, checksum_algorithm)
+                with open(part_path, 'ab' if offset else 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+                    for chunk in s.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            if time_to_first_byte is None:
+                                time_to_first_byte = time.perf_counter() - start_time
+                            write_start_time = time.perf_counter()
+                            f.write(chunk)
+                            write_stall_time += time.perf_counter() - write_start_time
+                            offset += len(chunk)
+                            bytes_downloaded += len(chunk)
+                            if hasher is not None:
+                                hasher.update(chunk)
+                    write_start_time = time.perf_counter()
+                    f.flush()
+                    write_stall_time += time.perf_counter() - write_start_time
+
+                if total_size is not None and offset < total_size:
+                    raise requests.exceptions.ConnectionError(f'Connection closed at byte {offset} of {total_size}')
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            if part_path is None or resumes >= retries:
+                raise
+            resumes += 1
+            retries_taken += 1
+            offset = part_path.stat().st_size if part_path.exists() and validator is not None else 0
+            logging.warning(f'Download of {url} interrupted at byte {offset}; resuming')
+            time.sleep(backoff_factor * 2 ** (resumes - 1))
+            continue
+        break
+
+    assert download_path is not None and part_path is not None
+    if total_size is not None and offset != total_size:
+        _discard_part_file(part_path)
+        raise requests.exceptions.RequestException(f'Downloaded {offset} bytes of {url} but expected {total_size}')
+    part_path.replace(download_path)
+    _get_validator_path(part_path).unlink(missing_ok=True)
+
+    if stats_callback is not None:
+        stats_callback(
+            DownloadStats(
+                url=url,
+                bytes_downloaded=bytes_downloaded,
+                elapsed_time=time.perf_counter() - start_time,
+                time_to_first_byte=time_to_first_byte,
+                retries=retries_taken,
+                write_stall_time=write_stall_time,
+            )
+        )
+    return download_path, hasher.hexdigest() if hasher is not None else None, server_checksum
+
+
+def _new_hasher(algorithm: str):
+    if algorithm.lower() == 'crc32c':
+        try:
+            google_crc32c = importlib.import_module('google_crc32c')
+        except ImportError as e:
+            raise ImportError('The google-crc32c package is required for CRC32C checksums') from e
+        return google_crc32c.Checksum()
+    return hashlib.new(algorithm)
+
+
+def _hash_file(hasher, path: Path) -> None:
+    with open(path, 'rb') as f:
+        while chunk := f.read(2**20):
+            hasher.update(chunk)
+
+
+def _get_server_checksum(headers, algorithm: str) -> Optional[str]:
+    """Get a hex digest from the checksum headers commonly sent by S3, Google Cloud Storage, and other servers"""
+    algorithm = algorithm.lower().replace('-', '')
+    checksums = {}
+    if 'content-md5' in headers:
+        checksums['md5'] = headers['content-md5']
+    for value in headers.get('x-goog-hash', '').split(','):
+        if '=' in value:
+            name, checksum = value.strip().split('=', 1)
+            checksums[name.lower()] = checksum
+    for name in ('sha256', 'sha1', 'crc32c'):
+        if f'x-amz-checksum-{name}' in headers:
+            checksums[name] = headers[f'x-amz-checksum-{name}']
+
+    if algorithm not in checksums:
+        return None
+    return base64.b64decode(checksums[algorithm]).hex()
+
+
+def _download_segment(
+    session: requests.Session,
+    url: str,
+    download_path: Path,
+    chunk_size,
+    retries: int,
+    backoff_factor: float,
+    auth: Optional[Tuple[str, str]],
+    headers: dict,
+    byte_range: Tuple[int, int],
+) -> None:
+    """Download a byte range of a file into place, resuming the rest of the range if the connection drops"""
+    start, end = byte_range
+    position = start
+    resumes = 0
+    while True:
+        range_headers = {'Range': f'bytes={position}-{end}'}
+        try:
+            with session.get(url, stream=True, auth=auth, headers={**headers, **range_headers}) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise requests.HTTPError(f'Range request not honored for {url}', response=response)
+                content_range = response.headers.get('content-range', '')
+                if not content_range.startswith(f'bytes {position}-{end}/'):
+                    raise requests.HTTPError(
+                        f'Got Content-Range {content_range!r} for bytes {position}-{end} of {url}', response=response
+                    )
+                with open(download_path, 'r+b') as f:
+                    f.seek(position)
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if position + len(chunk) > end + 1:
+                            raise requests.HTTPError(f'Got more than bytes {start}-{end} of {url}', response=response)
+                        f.write(chunk)
+                        position += len(chunk)
+            if position <= end:
+                raise requests.exceptions.ConnectionError(f'Connection closed at byte {position} of {start}-{end}')
+            return
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            if resumes >= retries:
+                raise
+            resumes += 1
+            logging.warning(f'Download of bytes {start}-{end} of {url} interrupted at byte {position}; resuming')
+            time.sleep(backoff_factor * 2 ** (resumes - 1))
+
+
+def _download_in_segments(
+    session: requests.Session,
+    url: str,
+    directory: Union[Path, str],
+    segments: int,
+    chunk_size,
+    retries: int,
+    backoff_factor: float,
+    auth: Optional[Tuple[str, str]],
+    headers: dict,
+) -> Optional[Path]:
+    """Download a file as several concurrent byte range requests, if the server supports them
+
+    Each range is checked against the `Content-Range` of its response and the number of bytes received, and a range
+    cut short is resumed. The preallocated `.part` file is deleted if any range fails, so it's never resumed.
+    """
+    with session.head(url, allow_redirects=True, auth=auth, headers=headers) as response:
+        if not response.ok or response.headers.get('accept-ranges', '').lower() != 'bytes':
+            return None
+        size = int(response.headers.get('content-length', 0))
+        if size == 0:
+            return None
+        download_path = _get_download_path(response.url, response.headers.get('content-disposition'), directory)
+        validator = _get_validator(response.headers)
+
+    segment_size = math.ceil(size / segments)
+    byte_ranges = [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+    segment_headers = {**headers, 'If-Range': validator} if validator else headers
+
+    start_time = time.perf_counter()
+    part_path = _get_part_path(download_path)
+    _discard_part_file(part_path)
+    with open(part_path, 'wb') as f:
+        f.truncate(size)
+    try:
+        with ThreadPoolExecutor(max_workers=segments) as executor:
+            download_segment = partial(
+                _download_segment, session, url, part_path, chunk_size, retries, backoff_factor, auth, segment_headers
+            )
+            list(executor.map(download_segment, byte_ranges))
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+    part_path.replace(download_path)
+    elapsed = time.perf_counter() - start_time
+
+    logging.info(f'Downloaded {size} bytes in {len(byte_ranges)} segments at {size / elapsed / 2**20:.1f} MiB/s')
+    return download_path
+
+
 def download_file(
     url: str,
     directory: Union[Path, str] = '.',
@@ -49,9 +442,14 @@ def download_file(
     backoff_factor=1,
     auth: Optional[Tuple[str, str]] = None,
     token: Optional[str] = None,
+    segments: int = 1,
+    stats_callback: Optional[Callable[[DownloadStats], None]] = None,
 ) -> str:
     """Download a file
 
+    The file is written to a `.part` file that's renamed into place once it's complete. A dropped connection, or a
+    `.part` file left behind by an earlier attempt, is resumed with a range request rather than starting over.
+
     Args:
         url: URL of the file to download
         directory: Directory location to place files into
@@ -60,32 +458,303 @@ def download_file(
         backoff_factor: Factor for calculating time between retries
         auth: Username and password for HTTP Basic Auth
         token: Token for HTTP Bearer authentication
+        segments: Number of byte ranges to download concurrently. Falls back to a single stream if the server doesn't
+          report `Accept-Ranges: bytes` and a `Content-Length`. Segments beyond the `pool_maxsize` set with
+          `configure_session_pool` open connections that aren't kept alive.
+        stats_callback: Called with the `DownloadStats` of the download once it's complete. Not called for segmented
+          downloads.
 
     Returns:
         download_path: The path to the downloaded file
     """
     logging.info(f'Downloading {url}')
 
-    session = requests.Session()
-    session.auth = auth
-    if token:
-        session.headers.update({'Authorization': f'Bearer {token}'})
+    session = get_session(retries, backoff_factor)
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
 
-    retry_strategy = Retry(
-        total=retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=[429, 500, 502, 503, 504],
+    if segments > 1:
+        segmented_download_path = _download_in_segments(
+            session, url, directory, segments, chunk_size, retries, backoff_factor, auth, headers
+        )
+        if segmented_download_path is not None:
+            return str(segmented_download_path)
+
+    download_path, _, _ = _download_with_resume(
+        session, url, directory, chunk_size, retries, backoff_factor, auth, headers, stats_callback=stats_callback
     )
-    session.mount('https://', HTTPAdapter(max_retries=retry_strategy))
-    session.mount('http://', HTTPAdapter(max_retries=retry_strategy))
-
-    with session.get(url, stream=True) as s:
-        download_path = _get_download_path(s.url, s.headers.get('content-disposition'), directory)
-        s.raise_for_status()
-        with open(download_path, 'wb') as f:
-            for chunk in s.iter_content(chunk_size=chunk_size):
-                if chunk:
-                    f.write(chunk)
-    session.close()
 
     return str(download_path)
+
+
+def download_files(
+    urls: Iterable[str],
+    directory: Union[Path, str] = '.',
+    max_concurrency: int = 4,
+    max_per_host: int = 2,
+    progress_callback: Optional[Callable[[int, int, int], None]] = None,
+    chunk_size=None,
+    retries=2,
+    backoff_factor=1,
+    auth: Optional[Tuple[str, str]] = None,
+    token: Optional[str] = None,
+) -> dict[str, Union[str, Exception]]:
+    """Download many files concurrently
+
+    Each file is downloaded with `download_file`. An error downloading one file doesn't stop the others; it's returned
+    in place of that file's download path. A URL whose file name is the same as an earlier URL's isn't downloaded, and
+    a `ValueError` is returned for it instead, so that the two downloads don't write to the same file.
+
+    Args:
+        urls: URLs of the files to download
+        directory: Directory location to place files into
+        max_concurrency: Maximum number of files to download at once
+        max_per_host: Maximum number of files to download at once from any one host
+        progress_callback: Called as `progress_callback(completed, total, bytes_downloaded)` after each file finishes
+        chunk_size: Size to chunk the downloads into
+        retries: Number of retries to attempt
+        backoff_factor: Factor for calculating time between retries
+        auth: Username and password for HTTP Basic Auth
+        token: Token for HTTP Bearer authentication
+
+    Returns:
+        results: The download path, or the exception raised downloading it, for each URL
+    """
+    urls = list(dict.fromkeys(urls))
+    results: dict[str, Union[str, Exception]] = {}
+    host_queues: dict[str, deque[str]] = {}
+    download_paths: dict[Path, str] = {}
+    for url in urls:
+        try:
+            download_path = _get_download_path(url, directory=directory)
+        except ValueError as e:
+            results[url] = e
+            continue
+        if download_path in download_paths:
+            results[url] = ValueError(f'{url} would be downloaded to the same file as {download_paths[download_path]}')
+            continue
+        download_paths[download_path] = url
+        host_queues.setdefault(urlparse(url).netloc, deque()).append(url)
+
+    completed = 0
+    bytes_downloaded = 0
+
+    def record(url: str, result: Union[str, Exception]) -> None:
+        nonlocal completed, bytes_downloaded
+        if isinstance(result, Exception):
+            logging.warning(f'Error downloading {url}: {result}')
+        else:
+            bytes_downloaded += Path(result).stat().st_size
+        results[url] = result
+        completed += 1
+        if progress_callback is not None:
+            progress_callback(completed, len(urls), bytes_downloaded)
+
+    for url, result in list(results.items()):
+        record(url, result)
+
+    # URLs are only handed to the pool once their host has a free slot, so a worker never waits on a busy host while
+    # other hosts' URLs are queued
+    host_counts = dict.fromkeys(host_queues, 0)
+    active: dict[Future, Tuple[str, str]] = {}
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        while active or any(host_queues.values()):
+            for host, queue in host_queues.items():
+                while queue and host_counts[host] < max_per_host:
+                    url = queue.popleft()
+                    future = executor.submit(
+                        download_file,
+                        url,
+                        directory=directory,
+                        chunk_size=chunk_size,
+                        retries=retries,
+                        backoff_factor=backoff_factor,
+                        auth=auth,
+                        token=token,
+                    )
+                    active[future] = (host, url)
+                    host_counts[host] += 1
+
+            done, _ = wait(active, return_when=FIRST_COMPLETED)
+            for future in done:
+                host, url = active.pop(future)
+                host_counts[host] -= 1
+                exception = future.exception()
+                record(url, exception if isinstance(exception, Exception) else future.result())
+
+    results = {url: results[url] for url in urls}
+    failures = sum(isinstance(result, Exception) for result in results.values())
+    logging.info(
+        f'Downloaded {len(urls) - failures} of {len(urls)} files ({bytes_downloaded} bytes); {failures} failed'
+    )
+    return results
+
+
+def download_file_with_checksum(
+    url: str,
+    directory: Union[Path, str] = '.',
+    checksum_algorithm: str = 'sha256',
+    expected_checksum: Optional[str] = None,
+    chunk_size=None,
+    retries=2,
+    backoff_factor=1,
+    auth: Optional[Tuple[str, str]] = None,
+    token: Optional[str] = None,
+    stats_callback: Optional[Callable[[DownloadStats], None]] = None,
+) -> Tuple[str, str]:
+    """Download a file, computing its checksum as it's written
+
+    The checksum is verified against `expected_checksum` or, if that isn't provided, a checksum reported in the
+    server's response headers (`Content-MD5`, `x-goog-hash`, or `x-amz-checksum-*`). On a mismatch the file is deleted
+    and downloaded again.
+
+    Args:
+        url: URL of the file to download
+        directory: Directory location to place files into
+        checksum_algorithm: Any `hashlib` algorithm name, e.g. `md5` or `sha256`, or `crc32c` if the `google-crc32c`
+          package is installed
+        expected_checksum: Expected hex digest of the file
+        chunk_size: Size to chunk the download into
+        retries: Number of retries to attempt
+        backoff_factor: Factor for calculating time between retries
+        auth: Username and password for HTTP Basic Auth
+        token: Token for HTTP Bearer authentication
+        stats_callback: Called with the `DownloadStats` of each download attempt once it's complete
+
+    Returns: Tuple of:
+        download_path: The path to the downloaded file
+        checksum: Hex digest of the downloaded file
+    """
+    logging.info(f'Downloading {url}')
+
+    session = get_session(retries, backoff_factor)
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+
+    for attempt in range(retries + 1):
+        download_path, checksum, server_checksum = _download_with_resume(
+            session,
+            url,
+            directory,
+            chunk_size,
+            retries,
+            backoff_factor,
+            auth,
+            headers,
+            checksum_algorithm,
+            stats_callback,
+        )
+        assert checksum is not None
+        reference_checksum = expected_checksum or server_checksum
+        if reference_checksum is None or checksum.lower() == reference_checksum.lower():
+            return str(download_path), checksum
+
+        download_path.unlink()
+        logging.warning(f'{checksum_algorithm} checksum {checksum} of {url} does not match {reference_checksum}')
+        if attempt < retries:
+            time.sleep(backoff_factor * 2**attempt)
+
+    raise requests.exceptions.RequestException(
+        f'{checksum_algorithm} checksum of {url} did not match after {retries + 1} attempts'
+    )
+
+
+def download_to_consumer(
+    url: str,
+    consumer: Callable[[bytes], object],
+    chunk_size=None,
+    retries=2,
+    backoff_factor=1,
+    auth: Optional[Tuple[str, str]] = None,
+    token: Optional[str] = None,
+) -> int:
+    """Stream a file to a consumer as it arrives, without writing it to disk
+
+    A dropped connection is resumed with a range request, so the consumer sees every byte exactly once and in order.
+    The ETag or `Last-Modified` date of the file is sent as `If-Range` when resuming, and the download fails rather
+    than resuming if the file has changed, the server responds with a different range, or the file has no validator
+    or a `Content-Encoding`.
+
+    Args:
+        url: URL of the file to download
+        consumer: Called with each chunk of the file, e.g. the `feed` method of an incremental parser
+        chunk_size: Size to chunk the download into
+        retries: Number of retries to attempt
+        backoff_factor: Factor for calculating time between retries
+        auth: Username and password for HTTP Basic Auth
+        token: Token for HTTP Bearer authentication
+
+    Returns:
+        size: Number of bytes passed to the consumer
+    """
+    logging.info(f'Streaming {url}')
+
+    session = get_session(retries, backoff_factor)
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    validator: Optional[str] = None
+    offset = 0
+    resumes = 0
+    while True:
+        range_headers = {'Range': f'bytes={offset}-', 'If-Range': validator} if offset and validator else {}
+        try:
+            with session.get(url, stream=True, auth=auth, headers={**headers, **range_headers}) as response:
+                response.raise_for_status()
+                if offset and (
+                    response.status_code != 206
+                    or 'content-encoding' in response.headers
+                    or not response.headers.get('content-range', '').startswith(f'bytes {offset}-')
+                    or _get_validator(response.headers) != validator
+                ):
+                    raise requests.exceptions.RequestException(
+                        f'Unable to resume {url} from byte {offset}; the file may have changed'
+                    )
+                if not offset and 'content-encoding' not in response.headers:
+                    validator = _get_validator(response.headers)
+                total_size = _get_total_size(response, offset)
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        consumer(chunk)
+                        offset += len(chunk)
+                if total_size is not None and offset < total_size:
+                    raise requests.exceptions.ConnectionError(f'Connection closed at byte {offset} of {total_size}')
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            # Without a validator, a resumed stream could splice together two versions of the file
+            if resumes >= retries or (offset and validator is None):
+                raise
+            resumes += 1
+            logging.warning(f'Stream of {url} interrupted at byte {offset}; resuming')
+            time.sleep(backoff_factor * 2 ** (resumes - 1))
+            continue
+        return offset
+
+
+def download_to_memory(
+    url: str,
+    chunk_size=None,
+    retries=2,
+    backoff_factor=1,
+    auth: Optional[Tuple[str, str]] = None,
+    token: Optional[str] = None,
+) -> bytes:
+    """Download a file into memory, without writing it to disk
+
+    Args:
+        url: URL of the file to download
+        chunk_size: Size to chunk the download into
+        retries: Number of retries to attempt
+        backoff_factor: Factor for calculating time between retries
+        auth: Username and password for HTTP Basic Auth
+        token: Token for HTTP Bearer authentication
+
+    Returns:
+        content: The content of the file
+    """
+    buffer = bytearray()
+    download_to_consumer(
+        url,
+        buffer.extend,
+        chunk_size=chunk_size,
+        retries=retries,
+        backoff_factor=backoff_factor,
+        auth=auth,
+        token=token,
+    )
+    return bytes(buffer)
@@ -1,25 +1,42 @@
 """Get Sentinel-1 orbit file(s) from ASF or ESA website"""
 
 import argparse
+import atexit
+import bisect
+import json
 import logging
 import os
 import re
+import shutil
 import sys
-from datetime import datetime
-from typing import Optional, Tuple
-from urllib.parse import urlparse
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple, Union
 
+import numpy as np
 import requests
 from lxml import html
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
 from hyp3lib import OrbitDownloadError
-from hyp3lib.fetch import download_file
+from hyp3lib.fetch import download_file, download_files, get_session
+from hyp3lib.util import get_cache_dir
 
 
 ESA_CREATE_TOKEN_URL = 'https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token'
 ESA_DELETE_TOKEN_URL = 'https://identity.dataspace.copernicus.eu/auth/realms/CDSE/account/sessions'
+ASF_ORBIT_URL = 'https://s1qc.asf.alaska.edu'
+ESA_SEARCH_URL = 'https://catalogue.dataspace.copernicus.eu/odata/v1/Products'
+ESA_DOWNLOAD_URL = 'https://zipper.dataspace.copernicus.eu/download'
+DEFAULT_ORBIT_RACE_TIMEOUT = 60.0
+ESA_TOKEN_TIMEOUT = 30.0
+
+_ORBIT_VALIDITY_PATTERN = re.compile(r'_V(\d{8}T\d{6})_(\d{8}T\d{6})\.EOF$')
 
 
 class EsaToken:
@@ -43,7 +60,7 @@ class EsaToken:
             'username': self.username,
             'password': self.password,
         }
-        response = requests.post(ESA_CREATE_TOKEN_URL, data=data)
+        response = get_session().post(ESA_CREATE_TOKEN_URL, data=data, timeout=ESA_TOKEN_TIMEOUT)
         response.raise_for_status()
         self.session_id = response.json()['session_state']
         self.token = response.json()['access_token']
@@ -51,32 +68,524 @@ class EsaToken:
         return self.token
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        response = requests.delete(
+        response = get_session().delete(
             url=f'{ESA_DELETE_TOKEN_URL}/{self.session_id}',
             headers={'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json'},
+            timeout=ESA_TOKEN_TIMEOUT,
         )
         response.raise_for_status()
 
 
-def _get_asf_orbit_url(orbit_type, platform, timestamp):
-    search_url = f'https://s1qc.asf.alaska.edu/{orbit_type.lower()}/'
+class EsaTokenManager:
+    """Thread-safe, reusable authentication tokens for the ESA Copernicus Data Space Ecosystem (CDSE)
 
-    hostname = urlparse(search_url).hostname
-    session = requests.Session()
-    retries = Retry(
-        total=3,
-        backoff_factor=10,
-        status_forcelist=[429, 500, 503, 504],
-    )
-    assert hostname is not None
-    session.mount(hostname, HTTPAdapter(max_retries=retries))
-    response = session.get(search_url)
+    Unlike `EsaToken`, which creates and deletes a CDSE session every time it's used, the access token is reused until
+    shortly before it expires and then refreshed with the refresh token, and the session is only deleted when the
+    manager is closed.
+    """
+
+    def __init__(self, username: str, password: str, expiry_margin: float = 60.0, timeout: float = ESA_TOKEN_TIMEOUT):
+        """
+        Args:
+            username: CDSE username
+            password: CDSE password
+            expiry_margin: Seconds before a token expires to stop using it
+            timeout: Connect and read timeout, in seconds, for each request to CDSE
+        """
+        self.username = username
+        self.password = password
+        self.expiry_margin = expiry_margin
+        self.timeout = timeout
+        self.token: str | None = None
+        self.session_id: str | None = None
+        self._refresh_token: str | None = None
+        self._expires_at = 0.0
+        self._refresh_expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'EsaTokenManager':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _request_token(self, data: dict) -> None:
+        response = get_session().post(
+            ESA_CREATE_TOKEN_URL, data={'client_id': 'cdse-public', **data}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        payload = response.json()
+        now = time.monotonic()
+        self.token = payload['access_token']
+        self.session_id = payload['session_state']
+        self._refresh_token = payload.get('refresh_token')
+        self._expires_at = now + payload.get('expires_in', 0)
+        self._refresh_expires_at = now + payload.get('refresh_expires_in', 0)
+
+    def _delete_session(self, session_id: str, token: str) -> None:
+        response = get_session().delete(
+            url=f'{ESA_DELETE_TOKEN_URL}/{session_id}',
+            headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
+    def _get_token(self) -> str:
+        now = time.monotonic()
+        if self.token is not None and now < self._expires_at - self.expiry_margin:
+            return self.token
+
+        if self._refresh_token is not None and now < self._refresh_expires_at - self.expiry_margin:
+            try:
+                self._request_token({'grant_type': 'refresh_token', 'refresh_token': self._refresh_token})
+                assert self.token is not None
+                return self.token
+            except requests.HTTPError:
+                logging.warning('Unable to refresh CDSE access token; requesting a new one')
+
+        previous_session_id = self.session_id
+        self._request_token({'grant_type': 'password', 'username': self.username, 'password': self.password})
+        assert self.token is not None
+        if previous_session_id is not None and previous_session_id != self.session_id:
+            # The previous session's token may have expired, so it's deleted with the new session's token
+            try:
+                self._delete_session(previous_session_id, self.token)
+            except requests.RequestException:
+                logging.warning(f'Unable to delete previous CDSE session for {self.username}')
+        return self.token
+
+    def get_token(self) -> str:
+        """Get a valid access token, creating or refreshing it if needed"""
+        with self._lock:
+            return self._get_token()
+
+    def close(self) -> None:
+        """Delete the CDSE session, if one was created, refreshing the access token first if it has expired"""
+        with self._lock:
+            if self.session_id is None:
+                return
+            token = self._get_token()
+            session_id = self.session_id
+            self.token = None
+            self.session_id = None
+            self._refresh_token = None
+            self._delete_session(session_id, token)
+
+
+_ESA_TOKEN_MANAGERS: dict[Tuple[str, str], EsaTokenManager] = {}
+_ESA_TOKEN_MANAGERS_LOCK = threading.Lock()
+
+
+def _close_esa_token_managers() -> None:
+    with _ESA_TOKEN_MANAGERS_LOCK:
+        for token_manager in _ESA_TOKEN_MANAGERS.values():
+            try:
+                token_manager.close()
+            except requests.Timeout:
+                logging.warning(f'Timed out deleting CDSE session for {token_manager.username}')
+            except requests.RequestException:
+                logging.warning(f'Unable to delete CDSE session for {token_manager.username}')
+        _ESA_TOKEN_MANAGERS.clear()
+
+
+atexit.register(_close_esa_token_managers)
+
+
+def get_esa_token_manager(username: str, password: str) -> EsaTokenManager:
+    """Get the process-wide ESA token manager for a CDSE username and password
+
+    The manager's CDSE session is deleted when the process exits.
+    """
+    with _ESA_TOKEN_MANAGERS_LOCK:
+        if (username, password) not in _ESA_TOKEN_MANAGERS:
+            _ESA_TOKEN_MANAGERS[(username, password)] = EsaTokenManager(username, password)
+        return _ESA_TOKEN_MANAGERS[(username, password)]
+
+
+@contextmanager
+def _get_esa_token(
+    esa_credentials: Optional[Tuple[str, str]], esa_token_manager: Optional[EsaTokenManager]
+) -> Iterator[str]:
+    if esa_token_manager is not None:
+        yield esa_token_manager.get_token()
+    else:
+        assert esa_credentials is not None
+        with EsaToken(*esa_credentials) as token:
+            yield token
+
+
+def _to_epoch_seconds(timestamp: datetime) -> int:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp())
+
+
+def _parse_orbit_validity(orbit_file: str) -> Optional[Tuple[int, int]]:
+    """Get the validity start and end of an orbit file, in seconds since the epoch, from its name"""
+    match = _ORBIT_VALIDITY_PATTERN.search(orbit_file)
+    if match is None:
+        return None
+    start, end = (_to_epoch_seconds(datetime.strptime(time, '%Y%m%dT%H%M%S')) for time in match.groups())
+    return start, end
+
+
+def _get_granule_times(granule: str) -> Tuple[datetime, datetime]:
+    start_time, end_time = re.split('_+', granule)[4:6]
+    return datetime.strptime(start_time, '%Y%m%dT%H%M%S'), datetime.strptime(end_time, '%Y%m%dT%H%M%S')
+
+
+def _rank_by_name(names: list[str]) -> np.ndarray:
+    return np.argsort(np.argsort(np.array(names)))
+
+
+def _rank_by_window(names: list[str], starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # Longest validity window first, then first by name
+    order = np.lexsort((-_rank_by_name(names), ends - starts))
+    preference = np.empty(len(names), dtype=np.int64)
+    preference[order] = np.arange(len(names))
+    return preference
+
+
+def _select_orbit_files(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    preference: np.ndarray,
+    granule_starts: np.ndarray,
+    granule_ends: np.ndarray,
+) -> np.ndarray:
+    """Select the most preferred orbit file covering each granule in one vectorized pass
+
+    An orbit file covers a granule if its validity window starts before the granule starts and ends after the granule
+    ends. Only the orbit files that start less than the longest validity window before the granule ends are considered.
+
+    Args:
+        starts: Validity start of each orbit file, in ascending order
+        ends: Validity end of each orbit file
+        preference: Unique, non-negative preference of each orbit file; higher is preferred
+        granule_starts: Start time of each granule
+        granule_ends: End time of each granule
+
+    Returns:
+        The index of the selected orbit file for each granule, or -1 if no orbit file covers it
+    """
+    selected = np.full(len(granule_starts), -1, dtype=np.int64)
+    if len(starts) == 0 or len(granule_starts) == 0:
+        return selected
+
+    first = np.searchsorted(starts, granule_ends - np.max(ends - starts), side='right')
+    last = np.searchsorted(starts, granule_starts, side='left')
+    width = int(np.max(last - first))
+    if width <= 0:
+        return selected
+
+    candidates = first[:, np.newaxis] + np.arange(width)
+    in_range = candidates < last[:, np.newaxis]
+    candidates = np.minimum(candidates, len(starts) - 1)
+    covers = in_range & (ends[candidates] > granule_ends[:, np.newaxis])
+    scores = np.where(covers, preference[candidates], -1)
+
+    best = np.argmax(scores, axis=1)
+    rows = np.arange(len(granule_starts))
+    return np.where(scores[rows, best] >= 0, candidates[rows, best], selected)
+
+
+def _list_asf_orbit_files(orbit_type: str, platform: str, timeout: Optional[float] = None) -> list[str]:
+    search_url = f'{ASF_ORBIT_URL}/{orbit_type.lower()}/'
+
+    response = get_session(retries=3, backoff_factor=10).get(search_url, timeout=timeout)
     response.raise_for_status()
     tree = html.fromstring(response.content)
-    file_list = [
-        file for file in tree.xpath('//a[@href]//@href') if file.startswith(platform) and file.endswith('.EOF')
+    return [
+        file.strip() for file in tree.xpath('//a[@href]//@href') if file.startswith(platform) and file.endswith('.EOF')
     ]
 
+
+class OrbitCatalog:
+    """Persisted index of the orbit files available from ASF, keyed by platform and orbit type
+
+    The orbit files for each platform and orbit type are kept sorted by the start of their validity window, so the
+    orbit file covering a time is found with a binary search bounded by the longest validity window rather than a scan
+    of the whole ASF listing.
+    """
+
+    def __init__(self, path: Optional[Union[Path, str]] = None, offline: bool = False):
+        """
+        Args:
+            path: JSON file to persist the catalog in; defaults to `orbit_catalog.json` in the hyp3lib cache directory
+            offline: Only use the orbit files already in the catalog, never refreshing it from ASF
+        """
+        self.path = Path(path) if path is not None else get_cache_dir('orbits') / 'orbit_catalog.json'
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._index: dict[str, dict] = {}
+        if self.path.exists():
+            self._index = json.loads(self.path.read_text())
+
+    @staticmethod
+    def _get_key(platform: str, orbit_type: str) -> str:
+        return f'{platform}_{orbit_type.upper()}'
+
+    def add(self, platform: str, orbit_type: str, orbit_files: Iterable[str]) -> int:
+        """Add orbit files to the catalog
+
+        Args:
+            platform: Sentinel-1 platform of the orbit files, e.g. `S1A`
+            orbit_type: Orbit type of the orbit files, e.g. `AUX_POEORB`
+            orbit_files: Orbit file names
+
+        Returns:
+            The number of orbit files that weren't already in the catalog
+        """
+        entry = self._index.setdefault(
+            self._get_key(platform, orbit_type), {'names': [], 'starts': [], 'ends': [], 'max_window': 0}
+        )
+        known_files = set(entry['names'])
+        new_records = []
+        for orbit_file in orbit_files:
+            validity = _parse_orbit_validity(orbit_file)
+            if orbit_file in known_files or validity is None:
+                continue
+            known_files.add(orbit_file)
+            new_records.append((validity[0], orbit_file, validity[1]))
+
+        if new_records:
+            records = sorted([*zip(entry['starts'], entry['names'], entry['ends']), *new_records])
+            entry['starts'] = [start for start, _, _ in records]
+            entry['names'] = [name for _, name, _ in records]
+            entry['ends'] = [end for _, _, end in records]
+            entry['max_window'] = max(end - start for start, _, end in records)
+        return len(new_records)
+
+    def refresh(self, platform: str, orbit_type: str, timeout: Optional[float] = None) -> int:
+        """Add any new orbit files in the ASF listing for a platform and orbit type to the catalog, and save it
+
+        Args:
+            platform: Sentinel-1 platform, e.g. `S1A`
+            orbit_type: Orbit type, e.g. `AUX_POEORB`
+            timeout: Connect and read timeout, in seconds, for the ASF listing request
+
+        Returns:
+            The number of new orbit files
+        """
+        new_files = self.add(platform, orbit_type, _list_asf_orbit_files(orbit_type, platform, timeout=timeout))
+        self.save()
+        return new_files
+
+    def save(self) -> None:
+        """Atomically write the catalog to its JSON file"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=self.path.parent, suffix='.tmp', delete=False) as f:
+            json.dump(self._index, f)
+        os.replace(f.name, self.path)
+
+    def find(self, platform: str, orbit_type: str, timestamp: datetime) -> Optional[str]:
+        """Find the orbit file in the catalog whose validity window contains a time, without refreshing it
+
+        If several orbit files contain the time, the one with the longest validity window is chosen, and then the
+        first by name.
+
+        Args:
+            platform: Sentinel-1 platform, e.g. `S1A`
+            orbit_type: Orbit type, e.g. `AUX_POEORB`
+            timestamp: Time to find an orbit file for; naive datetimes are treated as UTC
+
+        Returns:
+            The name of the orbit file, or None if no orbit file in the catalog contains the time
+        """
+        entry = self._index.get(self._get_key(platform, orbit_type))
+        if not entry:
+            return None
+
+        time = _to_epoch_seconds(timestamp)
+        first = bisect.bisect_right(entry['starts'], time - entry['max_window'])
+        last = bisect.bisect_left(entry['starts'], time)
+
+        best: Optional[Tuple[int, str]] = None
+        for start, name, end in zip(entry['starts'][first:last], entry['names'][first:last], entry['ends'][first:last]):
+            if end > time and (best is None or (-(end - start), name) < best):
+                best = (-(end - start), name)
+        return best[1] if best is not None else None
+
+    def find_many(self, platform: str, orbit_type: str, timestamps: Iterable[datetime]) -> list[Optional[str]]:
+        """Find the orbit files in the catalog containing many times in one vectorized pass, without refreshing it
+
+        Orbit files are chosen as for `find`.
+
+        Args:
+            platform: Sentinel-1 platform, e.g. `S1A`
+            orbit_type: Orbit type, e.g. `AUX_POEORB`
+            timestamps: Times to find orbit files for; naive datetimes are treated as UTC
+
+        Returns:
+            The name of the orbit file containing each time, or None if no orbit file in the catalog contains it
+        """
+        times = np.array([_to_epoch_seconds(timestamp) for timestamp in timestamps], dtype=np.int64)
+        entry = self._index.get(self._get_key(platform, orbit_type))
+        if not entry:
+            return [None] * len(times)
+
+        starts = np.array(entry['starts'], dtype=np.int64)
+        ends = np.array(entry['ends'], dtype=np.int64)
+        selected = _select_orbit_files(starts, ends, _rank_by_window(entry['names'], starts, ends), times, times)
+        return [entry['names'][index] if index >= 0 else None for index in selected]
+
+    def get_orbit_urls(
+        self, platform: str, orbit_type: str, timestamps: Iterable[datetime], timeout: Optional[float] = None
+    ) -> list[Optional[str]]:
+        """Get the URLs of the ASF orbit files containing many times
+
+        The catalog is refreshed from ASF, at most once, only if it has no orbit file for one of the times, unless it's
+        offline.
+
+        Args:
+            platform: Sentinel-1 platform, e.g. `S1A`
+            orbit_type: Orbit type, e.g. `AUX_POEORB`
+            timestamps: Times to find orbit files for; naive datetimes are treated as UTC
+            timeout: Connect and read timeout, in seconds, for the ASF listing request if the catalog is refreshed
+
+        Returns:
+            The URL of the orbit file containing each time, or None if no orbit file contains it
+        """
+        timestamps = list(timestamps)
+        with self._lock:
+            orbit_files = self.find_many(platform, orbit_type, timestamps)
+            if None in orbit_files and not self.offline:
+                self.refresh(platform, orbit_type, timeout=timeout)
+                orbit_files = self.find_many(platform, orbit_type, timestamps)
+
+        return [
+            f'{ASF_ORBIT_URL}/{orbit_type.lower()}/{orbit_file}' if orbit_file is not None else None
+            for orbit_file in orbit_files
+        ]
+
+    def get_orbit_url(
+        self, platform: str, orbit_type: str, timestamp: datetime, timeout: Optional[float] = None
+    ) -> Optional[str]:
+        """Get the URL of the ASF orbit file whose validity window contains a time
+
+        The catalog is refreshed from ASF only if no orbit file in it contains the time, unless it's offline.
+
+        Args:
+            platform: Sentinel-1 platform, e.g. `S1A`
+            orbit_type: Orbit type, e.g. `AUX_POEORB`
+            timestamp: Time to find an orbit file for; naive datetimes are treated as UTC
+            timeout: Connect and read timeout, in seconds, for the ASF listing request if the catalog is refreshed
+
+        Returns:
+            The URL of the orbit file, or None if no orbit file contains the time
+        """
+        with self._lock:
+            orbit_file = self.find(platform, orbit_type, timestamp)
+            if orbit_file is None and not self.offline:
+                self.refresh(platform, orbit_type, timeout=timeout)
+                orbit_file = self.find(platform, orbit_type, timestamp)
+
+        if orbit_file is None:
+            return None
+        return f'{ASF_ORBIT_URL}/{orbit_type.lower()}/{orbit_file}'
+
+
+class OrbitFileCache:
+    """On-disk cache of orbit files that can be shared across jobs
+
+    Orbit files are found by the validity window in their names. Files are added atomically, so several processes can
+    share a cache directory, and the least recently used files are evicted once there are more than `max_files`.
+    """
+
+    def __init__(self, directory: Optional[Union[Path, str]] = None, max_files: int = 1000):
+        """
+        Args:
+            directory: Directory to cache orbit files in; defaults to the `HYP3LIB_ORBIT_CACHE_DIR` environment variable
+              or `files` in the hyp3lib orbit cache directory
+            max_files: Maximum number of orbit files to keep in the cache
+        """
+        if directory is None:
+            directory = os.environ.get('HYP3LIB_ORBIT_CACHE_DIR', get_cache_dir('orbits') / 'files')
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_files = max_files
+
+    def find(self, platform: str, orbit_type: str, start_time: datetime, end_time: datetime) -> Optional[Path]:
+        """Find a cached orbit file whose validity window covers a time range
+
+        If several cached orbit files cover the time range, the last by name (i.e. the most recently produced) is
+        chosen, as for ESA orbit files.
+
+        Args:
+            platform: Sentinel-1 platform, e.g. `S1A`
+            orbit_type: Orbit type, e.g. `AUX_POEORB`
+            start_time: Start of the time range; naive datetimes are treated as UTC
+            end_time: End of the time range; naive datetimes are treated as UTC
+
+        Returns:
+            The cached orbit file, or None if no cached orbit file covers the time range
+        """
+        start, end = _to_epoch_seconds(start_time), _to_epoch_seconds(end_time)
+        best = None
+        for orbit_file in self.directory.glob(f'{platform}_OPER_{orbit_type.upper()}_OPOD_*.EOF'):
+            validity = _parse_orbit_validity(orbit_file.name)
+            if validity is not None and validity[0] < start and validity[1] > end:
+                if best is None or orbit_file.name > best.name:
+                    best = orbit_file
+
+        if best is not None:
+            try:
+                best.touch()
+            except FileNotFoundError:
+                # Evicted by another process
+                return None
+        return best
+
+    def add(self, orbit_file: Union[Path, str]) -> Optional[Path]:
+        """Atomically copy an orbit file into the cache, evicting the least recently used files if it's full
+
+        Returns:
+            The cached orbit file, or None if the orbit file's name doesn't include a validity window
+        """
+        orbit_file = Path(orbit_file)
+        if _parse_orbit_validity(orbit_file.name) is None:
+            return None
+
+        cached_file = self.directory / orbit_file.name
+        if not cached_file.exists():
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as f:
+                with open(orbit_file, 'rb') as source:
+                    shutil.copyfileobj(source, f)
+            os.replace(f.name, cached_file)
+        cached_file.touch()
+        self._evict()
+        return cached_file
+
+    def _evict(self) -> None:
+        orbit_files = []
+        for orbit_file in self.directory.glob('*.EOF'):
+            try:
+                orbit_files.append((orbit_file.stat().st_mtime, orbit_file))
+            except FileNotFoundError:
+                continue
+        orbit_files.sort(reverse=True)
+        for _, orbit_file in orbit_files[self.max_files :]:
+            logging.info(f'Evicting {orbit_file.name} from the orbit file cache')
+            orbit_file.unlink(missing_ok=True)
+
+
+def _get_default_orbit_file_cache() -> Optional[OrbitFileCache]:
+    if 'HYP3LIB_ORBIT_CACHE_DIR' not in os.environ:
+        return None
+    return OrbitFileCache()
+
+
+def _copy_from_cache(cached_file: Path, directory: str) -> str:
+    orbit_file = Path(directory or '.') / cached_file.name
+    if orbit_file.resolve() != cached_file.resolve():
+        shutil.copyfile(cached_file, orbit_file)
+    return str(orbit_file)
+
+
+def _get_asf_orbit_url(orbit_type, platform, timestamp, timeout: Optional[float] = None):
+    search_url = f'{ASF_ORBIT_URL}/{orbit_type.lower()}/'
+    file_list = _list_asf_orbit_files(orbit_type, platform, timeout=timeout)
+
     d1 = 0.0
     best = None
     for file in file_list:
@@ -97,8 +606,10 @@ def _get_asf_orbit_url(orbit_type, platform, timestamp):
     return None
 
 
-def _get_esa_orbit_url(orbit_type: str, platform: str, start_time: datetime, end_time: datetime):
-    search_url = 'https://catalogue.dataspace.copernicus.eu/odata/v1/Products'
+def _get_esa_orbit_url(
+    orbit_type: str, platform: str, start_time: datetime, end_time: datetime, timeout: Optional[float] = None
+):
+    search_url = ESA_SEARCH_URL
 
     date_format = '%Y-%m-%dT%H:%M:%SZ'
     params: dict = {
@@ -110,25 +621,109 @@ def _get_esa_orbit_url(orbit_type: str, platform: str, start_time: datetime, end
         '$top': 1,
     }
 
-    response = requests.get(search_url, params=params)
+    response = get_session().get(search_url, params=params, timeout=timeout)
     response.raise_for_status()
     data = response.json()
 
     orbit_url = None
     if data['value']:
         product_id = data['value'][0]['Id']
-        orbit_url = f'https://zipper.dataspace.copernicus.eu/download/{product_id}'
+        orbit_url = f'{ESA_DOWNLOAD_URL}/{product_id}'
 
     return orbit_url
 
 
-def get_orbit_url(granule: str, orbit_type: str = 'AUX_POEORB', provider: str = 'ESA'):
+def _parse_esa_date(date: str) -> int:
+    return _to_epoch_seconds(datetime.fromisoformat(date.replace('Z', '+00:00')))
+
+
+def _list_esa_orbit_products(
+    orbit_type: str,
+    platform: str,
+    start_time: datetime,
+    end_time: datetime,
+    page_size: int = 1000,
+    timeout: Optional[float] = None,
+) -> list[dict]:
+    """List the ESA orbit products whose validity window overlaps a time range
+
+    CDSE caps `$skip`, so each page is requested by advancing the `ContentDate/Start` filter to the start of the last
+    product seen instead. Products on the boundary between two pages are returned by both, and are deduplicated by ID.
+    """
+    date_format = '%Y-%m-%dT%H:%M:%SZ'
+    search_filter = (
+        f"Collection/Name eq 'SENTINEL-1' and "
+        f"startswith(Name, '{platform}_OPER_{orbit_type}_OPOD_') and "
+        f'ContentDate/Start lt {end_time.strftime(date_format)} and '
+        f'ContentDate/End gt {start_time.strftime(date_format)}'
+    )
+    params: dict = {'$filter': search_filter, '$orderby': 'ContentDate/Start asc', '$top': page_size}
+
+    products: dict[str, dict] = {}
+    while True:
+        response = get_session().get(ESA_SEARCH_URL, params=params, timeout=timeout)
+        response.raise_for_status()
+        page = response.json()['value']
+        new_products = {product['Id']: product for product in page if product['Id'] not in products}
+        products.update(new_products)
+        # A full page of products that all start at the boundary can't be advanced past
+        if len(page) < page_size or not new_products:
+            return list(products.values())
+        params['$filter'] = f'{search_filter} and ContentDate/Start ge {page[-1]["ContentDate"]["Start"]}'
+
+
+def _get_esa_orbit_urls(
+    orbit_type: str,
+    platform: str,
+    start_times: list[datetime],
+    end_times: list[datetime],
+    timeout: Optional[float] = None,
+) -> list[Optional[str]]:
+    products = _list_esa_orbit_products(orbit_type, platform, min(start_times), max(end_times), timeout=timeout)
+    products.sort(key=lambda product: _parse_esa_date(product['ContentDate']['Start']))
+    names = [product['Name'] for product in products]
+    starts = np.array([_parse_esa_date(product['ContentDate']['Start']) for product in products], dtype=np.int64)
+    ends = np.array([_parse_esa_date(product['ContentDate']['End']) for product in products], dtype=np.int64)
+
+    granule_starts = np.array([_to_epoch_seconds(start_time) for start_time in start_times], dtype=np.int64)
+    granule_ends = np.array([_to_epoch_seconds(end_time) for end_time in end_times], dtype=np.int64)
+    selected = _select_orbit_files(starts, ends, _rank_by_name(names), granule_starts, granule_ends)
+    return [f'{ESA_DOWNLOAD_URL}/{products[index]["Id"]}' if index >= 0 else None for index in selected]
+
+
+def _get_asf_orbit_urls(
+    orbit_type: str, platform: str, start_times: list[datetime], timeout: Optional[float] = None
+) -> list[Optional[str]]:
+    orbit_files = []
+    for orbit_file in _list_asf_orbit_files(orbit_type, platform, timeout=timeout):
+        validity = _parse_orbit_validity(orbit_file)
+        if validity is not None:
+            orbit_files.append((validity[0], orbit_file, validity[1]))
+    orbit_files.sort()
+
+    names = [name for _, name, _ in orbit_files]
+    starts = np.array([start for start, _, _ in orbit_files], dtype=np.int64)
+    ends = np.array([end for _, _, end in orbit_files], dtype=np.int64)
+    times = np.array([_to_epoch_seconds(start_time) for start_time in start_times], dtype=np.int64)
+    selected = _select_orbit_files(starts, ends, _rank_by_window(names, starts, ends), times, times)
+    return [f'{ASF_ORBIT_URL}/{orbit_type.lower()}/{names[index]}' if index >= 0 else None for index in selected]
+
+
+def get_orbit_url(
+    granule: str,
+    orbit_type: str = 'AUX_POEORB',
+    provider: str = 'ESA',
+    catalog: Optional[OrbitCatalog] = None,
+    timeout: Optional[float] = None,
+):
     """Get the URL of a Sentinel-1 orbit file from a provider
 
     Args:
         granule: Sentinel-1 granule name to find an orbit file for
         orbit_type: Orbit type to download
         provider: Provider name to download the orbit file from
+        catalog: Orbit catalog to look up ASF orbit files in, rather than fetching the ASF listing
+        timeout: Connect and read timeout, in seconds, for the provider's search request
 
     Returns:
         orbit_url: The url to the matched orbit file
@@ -139,21 +734,125 @@ def get_orbit_url(granule: str, orbit_type: str = 'AUX_POEORB', provider: str =
     if provider.upper() == 'ESA':
         start_time = datetime.strptime(start_time, '%Y%m%dT%H%M%S')
         end_time = datetime.strptime(end_time, '%Y%m%dT%H%M%S')
-        return _get_esa_orbit_url(orbit_type, platform, start_time, end_time)
+        return _get_esa_orbit_url(orbit_type, platform, start_time, end_time, timeout=timeout)
 
     elif provider.upper() == 'ASF':
-        orbit_url = _get_asf_orbit_url(orbit_type.lower(), platform, start_time.replace('T', ''))
+        if catalog is not None:
+            return catalog.get_orbit_url(
+                platform, orbit_type, datetime.strptime(start_time, '%Y%m%dT%H%M%S'), timeout=timeout
+            )
+        orbit_url = _get_asf_orbit_url(orbit_type.lower(), platform, start_time.replace('T', ''), timeout=timeout)
         return orbit_url
 
     raise OrbitDownloadError(f'Unknown orbit file provider {provider}')
 
 
+def get_orbit_urls(
+    granules: Iterable[str],
+    orbit_type: str = 'AUX_POEORB',
+    provider: str = 'ESA',
+    catalog: Optional[OrbitCatalog] = None,
+    timeout: Optional[float] = None,
+) -> dict[str, Optional[str]]:
+    """Get the URLs of the Sentinel-1 orbit files for many granules from a provider
+
+    Granules are grouped by platform, and each group is resolved with a single ESA search over the time range of its
+    granules, or a single ASF listing, rather than a request per granule. Orbit files are chosen as by `get_orbit_url`.
+
+    Args:
+        granules: Sentinel-1 granule names to find orbit files for
+        orbit_type: Orbit type to download
+        provider: Provider name to download the orbit files from
+        catalog: Orbit catalog to look up ASF orbit files in, rather than fetching the ASF listing
+        timeout: Connect and read timeout, in seconds, for each of the provider's search requests
+
+    Returns:
+        orbit_urls: The URL of the matched orbit file for each granule, or None if no orbit file was found
+    """
+    if provider.upper() not in ('ESA', 'ASF'):
+        raise OrbitDownloadError(f'Unknown orbit file provider {provider}')
+
+    groups: dict[str, list[str]] = {}
+    for granule in dict.fromkeys(granules):
+        groups.setdefault(granule[0:3], []).append(granule)
+
+    orbit_urls: dict[str, Optional[str]] = {}
+    for platform, group in groups.items():
+        start_times, end_times = (list(times) for times in zip(*(_get_granule_times(granule) for granule in group)))
+        if provider.upper() == 'ESA':
+            urls = _get_esa_orbit_urls(orbit_type, platform, start_times, end_times, timeout=timeout)
+        elif catalog is not None:
+            urls = catalog.get_orbit_urls(platform, orbit_type, start_times, timeout=timeout)
+        else:
+            urls = _get_asf_orbit_urls(orbit_type.lower(), platform, start_times, timeout=timeout)
+        orbit_urls.update(zip(group, urls))
+
+    return orbit_urls
+
+
+def _get_provider_timeout(timeout: Optional[Union[float, dict[str, float]]], provider: str) -> Optional[float]:
+    """Get a provider's timeout from either one timeout for every provider or a mapping of provider names to timeouts"""
+    if isinstance(timeout, dict):
+        return {name.upper(): value for name, value in timeout.items()}.get(provider.upper())
+    return timeout
+
+
+class _OrbitUrlRace:
+    """Look up the orbit file URLs for every orbit type and provider of a granule concurrently
+
+    Results are collected in whatever order the caller asks for them, so the caller keeps its order of preference no
+    matter which lookup finishes first. Every lookup's requests time out, after `DEFAULT_ORBIT_RACE_TIMEOUT` if its
+    provider has no timeout, so no lookup thread can outlive the race indefinitely.
+    """
+
+    def __init__(
+        self,
+        granule: str,
+        orbit_types: Iterable[str],
+        providers: Iterable[str],
+        catalog: Optional[OrbitCatalog] = None,
+        timeout: Optional[Union[float, dict[str, float]]] = None,
+    ):
+        providers = list(providers)
+        timeouts: dict[str, float] = {}
+        for provider in providers:
+            provider_timeout = _get_provider_timeout(timeout, provider)
+            timeouts[provider] = provider_timeout if provider_timeout is not None else DEFAULT_ORBIT_RACE_TIMEOUT
+        pairs = [(orbit_type, provider) for orbit_type in orbit_types for provider in providers]
+        self._executor = ThreadPoolExecutor(max_workers=len(pairs) or 1)
+        self._futures: dict[Tuple[str, str], Future] = {
+            (orbit_type, provider): self._executor.submit(
+                get_orbit_url, granule, orbit_type, provider=provider, catalog=catalog, timeout=timeouts[provider]
+            )
+            for orbit_type, provider in pairs
+        }
+        start = time.monotonic()
+        self._deadlines = {provider: start + provider_timeout for provider, provider_timeout in timeouts.items()}
+
+    def result(self, orbit_type: str, provider: str) -> Optional[str]:
+        """Wait for the orbit file URL found for an orbit type and provider, until the provider's timeout"""
+        remaining = max(self._deadlines[provider] - time.monotonic(), 0)
+        try:
+            return self._futures[(orbit_type, provider)].result(timeout=remaining)
+        except FutureTimeoutError:
+            raise OrbitDownloadError(f'Timed out looking up {orbit_type} orbit file from {provider}')
+
+    def close(self) -> None:
+        """Cancel the lookups that haven't started, without waiting for those in flight"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
 def downloadSentinelOrbitFile(
     granule: str,
     directory: str = '',
     providers=('ESA', 'ASF'),
     orbit_types=('AUX_POEORB', 'AUX_RESORB'),
     esa_credentials: Optional[Tuple[str, str]] = None,
+    catalog: Optional[OrbitCatalog] = None,
+    cache: Optional[OrbitFileCache] = None,
+    race_providers: bool = False,
+    timeout: Optional[Union[float, dict[str, float]]] = None,
+    esa_token_manager: Optional[EsaTokenManager] = None,
 ):
     """Download a Sentinel-1 Orbit file
 
@@ -163,34 +862,195 @@ def downloadSentinelOrbitFile(
         providers: Iterable of providers to attempt to download the orbit file from, in order of preference
         orbit_types: Iterable of orbit file types to attempt to download, in order of preference
         esa_credentials: Copernicus Data Space Ecosystem (CDSE) username and password
+        catalog: Orbit catalog to look up ASF orbit files in, rather than fetching the ASF listing
+        cache: Orbit file cache to check for each orbit type before searching the providers, and to add downloaded
+          orbit files to; defaults to a cache in `HYP3LIB_ORBIT_CACHE_DIR` if that environment variable is set
+        race_providers: Look up the orbit file URLs from every provider for every orbit type concurrently, rather than
+          one at a time. The race only starts once the cache has no orbit file for an orbit type. The most preferred
+          orbit type and provider with a URL is still the one downloaded, once every more preferred lookup has failed
+          or timed out, and the remaining lookups are cancelled.
+        timeout: Timeout, in seconds, for looking up an orbit file URL from a provider, or a mapping of provider names
+          to timeouts, e.g. `{'ESA': 10, 'ASF': 30}`. When racing providers, a provider's timeout also bounds how long
+          its lookups are waited for, and defaults to `DEFAULT_ORBIT_RACE_TIMEOUT`.
+        esa_token_manager: Token manager to authenticate ESA downloads with, instead of creating a CDSE session
+          from `esa_credentials`
 
     Returns: Tuple of:
         orbit_file: The downloaded orbit file
-        provider: The provider used to download the orbit file from
+        provider: The provider used to download the orbit file from, or `cache` if it was found in the cache
 
     """
-    if 'ESA' in providers and esa_credentials is None:
-        raise ValueError('esa_credentials must be provided if ESA in providers')
+    if 'ESA' in providers and esa_credentials is None and esa_token_manager is None:
+        raise ValueError('esa_credentials or esa_token_manager must be provided if ESA in providers')
+    if cache is None:
+        cache = _get_default_orbit_file_cache()
+    return _download_sentinel_orbit_file(
+        granule,
+        directory,
+        providers,
+        orbit_types,
+        esa_credentials,
+        esa_token_manager,
+        catalog,
+        cache,
+        race_providers,
+        timeout,
+    )
+
+
+def _download_sentinel_orbit_file(
+    granule: str,
+    directory: str,
+    providers: Iterable[str],
+    orbit_types: Iterable[str],
+    esa_credentials: Optional[Tuple[str, str]],
+    esa_token_manager: Optional[EsaTokenManager],
+    catalog: Optional[OrbitCatalog],
+    cache: Optional[OrbitFileCache],
+    race_providers: bool,
+    timeout: Optional[Union[float, dict[str, float]]],
+) -> Tuple[str, str]:
+    start_time, end_time = _get_granule_times(granule)
+    orbit_types = list(orbit_types)
+    race: Optional[_OrbitUrlRace] = None
+    try:
+        for index, orbit_type in enumerate(orbit_types):
+            if cache is not None:
+                cached_file = cache.find(granule[0:3], orbit_type, start_time, end_time)
+                if cached_file is not None:
+                    return _copy_from_cache(cached_file, directory), 'cache'
+
+            if race_providers and race is None:
+                race = _OrbitUrlRace(granule, orbit_types[index:], providers, catalog, timeout)
+
+            for provider in providers:
+                try:
+                    if race is not None:
+                        url = race.result(orbit_type, provider)
+                    else:
+                        url = get_orbit_url(
+                            granule,
+                            orbit_type,
+                            provider=provider,
+                            catalog=catalog,
+                            timeout=_get_provider_timeout(timeout, provider),
+                        )
+                    if url is None:
+                        continue
+                    orbit_file: str | None = None
+                    if provider == 'ESA':
+                        with _get_esa_token(esa_credentials, esa_token_manager) as token:
+                            orbit_file = download_file(url, directory=directory, token=token)
+                    else:
+                        orbit_file = download_file(url, directory=directory)
+                    if orbit_file:
+                        if cache is not None:
+                            cache.add(orbit_file)
+                        return orbit_file, provider
+                except (requests.RequestException, OrbitDownloadError):
+                    logging.warning(
+                        f'Error encountered fetching {orbit_type} orbit file from {provider}; looking for another',
+                    )
+                    continue
+    finally:
+        if race is not None:
+            race.close()
+
+    raise OrbitDownloadError(f'Unable to find a valid orbit file from providers: {providers}')
+
+
+def downloadSentinelOrbitFiles(
+    granules: Iterable[str],
+    directory: str = '',
+    providers=('ESA', 'ASF'),
+    orbit_types=('AUX_POEORB', 'AUX_RESORB'),
+    esa_credentials: Optional[Tuple[str, str]] = None,
+    catalog: Optional[OrbitCatalog] = None,
+    cache: Optional[OrbitFileCache] = None,
+    esa_token_manager: Optional[EsaTokenManager] = None,
+    timeout: Optional[Union[float, dict[str, float]]] = None,
+) -> dict[str, Union[Tuple[str, str], OrbitDownloadError]]:
+    """Download the Sentinel-1 orbit files for many granules
+
+    Orbit files are found with `get_orbit_urls`, one orbit type and provider at a time in order of preference, for the
+    granules that don't have an orbit file yet. Each orbit file is downloaded only once, even if it covers several
+    granules.
+
+    Args:
+        granules: Granule names to find orbit files for
+        directory: Directory to save the orbit files into
+        providers: Iterable of providers to attempt to download the orbit files from, in order of preference
+        orbit_types: Iterable of orbit file types to attempt to download, in order of preference
+        esa_credentials: Copernicus Data Space Ecosystem (CDSE) username and password
+        catalog: Orbit catalog to look up ASF orbit files in, rather than fetching the ASF listing
+        cache: Orbit file cache to check for each orbit type before searching the providers, and to add downloaded
+          orbit files to; defaults to a cache in `HYP3LIB_ORBIT_CACHE_DIR` if that environment variable is set
+        esa_token_manager: Token manager to authenticate ESA downloads with, instead of creating a CDSE session
+          from `esa_credentials`
+        timeout: Timeout, in seconds, for each of a provider's search requests, or a mapping of provider names to
+          timeouts
+
+    Returns:
+        results: For each granule, a tuple of the downloaded orbit file and the provider it was downloaded from (or
+          `cache`), or the error raised if no orbit file could be downloaded
+    """
+    if 'ESA' in providers and esa_credentials is None and esa_token_manager is None:
+        raise ValueError('esa_credentials or esa_token_manager must be provided if ESA in providers')
+
+    if cache is None:
+        cache = _get_default_orbit_file_cache()
+
+    remaining = list(dict.fromkeys(granules))
+    results: dict[str, Union[Tuple[str, str], OrbitDownloadError]] = {}
     for orbit_type in orbit_types:
+        if cache is not None:
+            for granule in remaining:
+                cached_file = cache.find(granule[0:3], orbit_type, *_get_granule_times(granule))
+                if cached_file is not None:
+                    results[granule] = (_copy_from_cache(cached_file, directory), 'cache')
+            remaining = [granule for granule in remaining if granule not in results]
+
         for provider in providers:
+            if not remaining:
+                return results
             try:
-                url = get_orbit_url(granule, orbit_type, provider=provider)
-                orbit_file: str | None = None
-                if provider == 'ESA':
-                    assert esa_credentials is not None
-                    with EsaToken(*esa_credentials) as token:
-                        orbit_file = download_file(url, directory=directory, token=token)
-                else:
-                    orbit_file = download_file(url, directory=directory)
-                if orbit_file:
-                    return orbit_file, provider
+                orbit_urls = get_orbit_urls(
+                    remaining,
+                    orbit_type,
+                    provider=provider,
+                    catalog=catalog,
+                    timeout=_get_provider_timeout(timeout, provider),
+                )
             except (requests.RequestException, OrbitDownloadError):
                 logging.warning(
-                    f'Error encountered fetching {orbit_type} orbit file from {provider}; looking for another',
+                    f'Error encountered finding {orbit_type} orbit files from {provider}; looking for others'
                 )
                 continue
 
-    raise OrbitDownloadError(f'Unable to find a valid orbit file from providers: {providers}')
+            urls = {url for url in orbit_urls.values() if url is not None}
+            if not urls:
+                continue
+            if provider == 'ESA':
+                with _get_esa_token(esa_credentials, esa_token_manager) as token:
+                    downloads = download_files(urls, directory=directory or '.', token=token)
+            else:
+                downloads = download_files(urls, directory=directory or '.')
+            if cache is not None:
+                for result in downloads.values():
+                    if isinstance(result, str):
+                        cache.add(result)
+
+            for granule, url in orbit_urls.items():
+                download = downloads.get(url) if url is not None else None
+                if isinstance(download, str):
+                    results[granule] = (download, provider)
+                elif isinstance(download, Exception):
+                    logging.warning(f'Error encountered fetching {orbit_type} orbit file from {provider}: {download}')
+            remaining = [granule for granule in remaining if granule not in results]
+
+    for granule in remaining:
+        results[granule] = OrbitDownloadError(f'Unable to find a valid orbit file from providers: {providers}')
+    return results
 
 
 def main():
@@ -220,6 +1080,12 @@ def main():
         'See https://qc.sentinel1.eo.esa.int/',
     )
     parser.add_argument('-d', '--directory', default=os.getcwd(), help='Download files to this directory')
+    parser.add_argument(
+        '-b',
+        '--batch',
+        action='store_true',
+        help='Find the orbit files for all of the SAFE files together, downloading each orbit file only once',
+    )
     args = parser.parse_args()
 
     out = logging.StreamHandler(stream=sys.stdout)
@@ -228,6 +1094,17 @@ def main():
     err.setLevel(logging.WARNING)
     logging.basicConfig(format='%(message)s', level=logging.INFO, handlers=(out, err))
 
+    if args.batch:
+        results = downloadSentinelOrbitFiles(
+            args.safe_files, directory=args.directory, providers=args.provider, orbit_types=args.orbit_types
+        )
+        for safe, result in results.items():
+            if isinstance(result, OrbitDownloadError):
+                logging.warning(f'WARNING: unable to download orbit file for {safe}\n    {result}')
+            else:
+                logging.info('Downloaded orbit file {} from {}'.format(*result))
+        return
+
     for safe in args.safe_files:
         try:
             orbit_file, provided_by = downloadSentinelOrbitFile(
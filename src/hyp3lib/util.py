@@ -1,5 +1,8 @@
 """Small utility functions"""
 
+import os
+from pathlib import Path
+
 from osgeo import gdal
 
 
@@ -30,3 +33,21 @@ class GDALConfigManager:
 
 def string_is_true(s: str) -> bool:
     return s.lower() == 'true'
+
+
+def get_cache_dir(subdir: str) -> Path:
+    """Get a subdirectory of the hyp3lib cache directory, creating it if needed
+
+    The cache directory is `HYP3LIB_CACHE_DIR` if that environment variable is set, or else `hyp3lib` in
+    `XDG_CACHE_HOME` (`~/.cache` by default).
+
+    Args:
+        subdir: Name of the subdirectory, e.g. `dem`
+
+    Returns:
+        cache_dir: Path to the subdirectory
+    """
+    default_cache_dir = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'hyp3lib'
+    cache_dir = Path(os.environ.get('HYP3LIB_CACHE_DIR', default_cache_dir)) / subdir
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
@@ -1,4 +1,11 @@
+import hashlib
+import io
+import subprocess
+import sys
+from unittest.mock import patch
+
 import pytest
+from botocore.exceptions import ClientError
 from botocore.stub import ANY, Stubber
 
 from hyp3lib import aws
@@ -6,11 +13,62 @@ from hyp3lib import aws
 
 @pytest.fixture(autouse=True)
 def s3_stubber():
-    with Stubber(aws.S3_CLIENT) as stubber:
+    with Stubber(aws.get_s3_client()) as stubber:
         yield stubber
         stubber.assert_no_pending_responses()
 
 
+def test_import_does_not_create_s3_client():
+    code = 'import boto3, hyp3lib.aws; assert hyp3lib.aws._S3_CLIENT is None; assert boto3.DEFAULT_SESSION is None'
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def test_get_s3_client():
+    assert aws.get_s3_client() is aws.get_s3_client()
+    assert aws.S3_CLIENT is aws.get_s3_client()
+    with pytest.raises(AttributeError):
+        aws.foo
+
+
+def test_configure_s3_client():
+    original_client = aws.get_s3_client()
+    try:
+        aws.configure_s3_client(region_name='us-east-1', endpoint_url='http://localhost:9000', max_pool_connections=20)
+        s3_client = aws.get_s3_client()
+        assert s3_client is not original_client
+        assert s3_client.meta.region_name == 'us-east-1'
+        assert s3_client.meta.endpoint_url == 'http://localhost:9000'
+        assert s3_client.meta.config.max_pool_connections == 20
+    finally:
+        aws.configure_s3_client()
+        aws._S3_CLIENT = original_client
+
+
+def test_get_s3_client_default_session(monkeypatch):
+    monkeypatch.setattr(aws.boto3, 'DEFAULT_SESSION', aws.boto3.session.Session(region_name='eu-west-1'))
+    try:
+        aws.configure_s3_client()
+        assert aws.get_s3_client().meta.region_name == 'eu-west-1'
+
+        aws.configure_s3_client(session=aws.boto3.session.Session(region_name='ap-south-1'))
+        assert aws.get_s3_client().meta.region_name == 'ap-south-1'
+    finally:
+        aws.configure_s3_client()
+
+
+def test_get_s3_client_assigned(tmp_path):
+    file_to_upload = tmp_path / 'myFile.zip'
+    file_to_upload.touch()
+
+    with patch('hyp3lib.aws.S3_CLIENT') as mock_s3_client:
+        assert aws.get_s3_client() is mock_s3_client
+        aws.upload_file_to_s3(file_to_upload, 'myBucket')
+    mock_s3_client.upload_file.assert_called_once()
+    mock_s3_client.put_object_tagging.assert_called_once()
+    assert aws.get_s3_client() is not mock_s3_client
+    assert aws.S3_CLIENT is aws.get_s3_client()
+
+
 def test_get_tag_set():
     assert aws.get_tag_set('foo.zip') == {'TagSet': [{'Key': 'file_type', 'Value': 'product'}]}
     assert aws.get_tag_set('foo.png') == {'TagSet': [{'Key': 'file_type', 'Value': 'amp-browse'}]}
@@ -126,3 +184,185 @@ def test_upload_file_to_s3_multipart(tmp_path, s3_stubber):
     file_to_upload = tmp_path / 'myFile.txt'
     file_to_upload.write_text('a' * 10_000_000)
     aws.upload_file_to_s3(file_to_upload, 'myBucket', 'myPrefix', chunk_size=8_000_000)
+
+
+def test_get_tagging():
+    assert aws.get_tagging('foo.zip') == 'file_type=product'
+    assert aws.get_tagging('foo_rgb_thumb.png') == 'file_type=rgb-thumbnail'
+
+
+def test_upload_fileobj_to_s3(s3_stubber):
+    expected_params = {
+        'Body': ANY,
+        'Bucket': 'myBucket',
+        'Key': 'myPrefix/myFile_rgb.png',
+        'ContentType': 'image/png',
+        'Tagging': 'file_type=rgb-browse',
+        'ChecksumAlgorithm': 'CRC32',
+    }
+    s3_stubber.add_response(method='put_object', expected_params=expected_params, service_response={})
+    aws.upload_fileobj_to_s3(io.BytesIO(b'foo'), 'myBucket', 'myPrefix/myFile_rgb.png')
+
+    s3_stubber.add_response(method='put_object', expected_params=expected_params, service_response={})
+    aws.upload_fileobj_to_s3(b'foo', 'myBucket', 'myPrefix/myFile_rgb.png')
+
+
+def test_upload_directory_to_s3(tmp_path, s3_stubber):
+    (tmp_path / 'myFile.zip').touch()
+    (tmp_path / 'myFile_thumb.png').touch()
+    (tmp_path / 'subdir').mkdir()
+    (tmp_path / 'subdir' / 'myFile.txt').touch()
+
+    uploads = []
+
+    def record_upload(params, **kwargs):
+        uploads.append({key: value for key, value in params.items() if key != 'Body'})
+
+    for _ in range(3):
+        s3_stubber.add_response(method='put_object', service_response={})
+    aws.get_s3_client().meta.events.register('provide-client-params.s3.PutObject', record_upload)
+    try:
+        keys = aws.upload_directory_to_s3(tmp_path, 'myBucket', 'myPrefix', max_concurrency=2)
+    finally:
+        aws.get_s3_client().meta.events.unregister('provide-client-params.s3.PutObject', record_upload)
+
+    assert keys == ['myPrefix/myFile.zip', 'myPrefix/myFile_thumb.png', 'myPrefix/subdir/myFile.txt']
+    assert sorted(uploads, key=lambda upload: upload['Key']) == [
+        {
+            'Bucket': 'myBucket',
+            'Key': 'myPrefix/myFile.zip',
+            'ContentType': 'application/zip',
+            'Tagging': 'file_type=product',
+            'ChecksumAlgorithm': 'CRC32',
+        },
+        {
+            'Bucket': 'myBucket',
+            'Key': 'myPrefix/myFile_thumb.png',
+            'ContentType': 'image/png',
+            'Tagging': 'file_type=amp-thumbnail',
+            'ChecksumAlgorithm': 'CRC32',
+        },
+        {
+            'Bucket': 'myBucket',
+            'Key': 'myPrefix/subdir/myFile.txt',
+            'ContentType': 'text/plain',
+            'Tagging': 'file_type=product',
+            'ChecksumAlgorithm': 'CRC32',
+        },
+    ]
+
+
+def test_get_local_etag(tmp_path):
+    file_to_upload = tmp_path / 'myFile.txt'
+    file_to_upload.write_text('a' * 10)
+    assert aws.get_local_etag(file_to_upload, chunk_size=100) == f'"{hashlib.md5(b"a" * 10).hexdigest()}"'
+
+    # s3transfer raises part sizes to the 5 MiB S3 minimum
+    part_digest = hashlib.md5(b'a' * 10).digest()
+    assert aws.get_local_etag(file_to_upload, chunk_size=4) == f'"{hashlib.md5(part_digest).hexdigest()}-1"'
+
+    file_to_upload.write_bytes(b'a' * 12_000_000)
+    part_digests = hashlib.md5(b'a' * 8_000_000).digest() + hashlib.md5(b'a' * 4_000_000).digest()
+    assert aws.get_local_etag(file_to_upload, chunk_size=8_000_000) == f'"{hashlib.md5(part_digests).hexdigest()}-2"'
+
+
+def test_upload_file_to_s3_skip_if_unchanged(tmp_path, s3_stubber):
+    file_to_upload = tmp_path / 'myFile.zip'
+    file_to_upload.write_text('a' * 10)
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'myFile.zip'},
+        service_response={
+            'ContentLength': 10,
+            'ContentType': 'application/zip',
+            'ETag': aws.get_local_etag(file_to_upload),
+        },
+    )
+    s3_stubber.add_response(
+        method='get_object_tagging',
+        expected_params={'Bucket': 'myBucket', 'Key': 'myFile.zip'},
+        service_response={'TagSet': [{'Key': 'file_type', 'Value': 'product'}]},
+    )
+    aws.upload_file_to_s3(file_to_upload, 'myBucket', skip_if_unchanged=True)
+
+
+def test_upload_file_to_s3_skip_if_unchanged_tags(tmp_path, s3_stubber):
+    file_to_upload = tmp_path / 'myFile.zip'
+    file_to_upload.write_text('a' * 10)
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'myFile.zip'},
+        service_response={
+            'ContentLength': 10,
+            'ContentType': 'application/zip',
+            'ETag': aws.get_local_etag(file_to_upload),
+        },
+    )
+    s3_stubber.add_response(
+        method='get_object_tagging',
+        expected_params={'Bucket': 'myBucket', 'Key': 'myFile.zip'},
+        service_response={'TagSet': [{'Key': 'file_type', 'Value': 'amp-browse'}, {'Key': 'foo', 'Value': 'bar'}]},
+    )
+    s3_stubber.add_response(
+        method='put_object_tagging',
+        expected_params={
+            'Bucket': 'myBucket',
+            'Key': 'myFile.zip',
+            'Tagging': {'TagSet': [{'Key': 'file_type', 'Value': 'product'}, {'Key': 'foo', 'Value': 'bar'}]},
+        },
+        service_response={},
+    )
+    aws.upload_file_to_s3(file_to_upload, 'myBucket', skip_if_unchanged=True)
+
+
+def test_upload_file_to_s3_skip_if_unchanged_content_type(tmp_path, s3_stubber):
+    file_to_upload = tmp_path / 'myFile.zip'
+    file_to_upload.write_text('a' * 10)
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'myFile.zip'},
+        service_response={
+            'ContentLength': 10,
+            'ContentType': 'binary/octet-stream',
+            'ETag': aws.get_local_etag(file_to_upload),
+        },
+    )
+    s3_stubber.add_response(
+        method='put_object',
+        expected_params={
+            'Bucket': 'myBucket',
+            'Key': 'myFile.zip',
+            'ContentType': 'application/zip',
+            'Body': ANY,
+            'ChecksumAlgorithm': ANY,
+        },
+        service_response={},
+    )
+    s3_stubber.add_response(method='put_object_tagging', service_response={})
+    aws.upload_file_to_s3(file_to_upload, 'myBucket', skip_if_unchanged=True)
+
+
+def test_upload_file_to_s3_skip_if_unchanged_changed(tmp_path, s3_stubber):
+    file_to_upload = tmp_path / 'myFile.zip'
+    file_to_upload.write_text('a' * 10)
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'myFile.zip'},
+        service_response={'ContentLength': 10, 'ETag': '"foo"'},
+    )
+    s3_stubber.add_response(method='put_object', service_response={})
+    s3_stubber.add_response(method='put_object_tagging', service_response={})
+    aws.upload_file_to_s3(file_to_upload, 'myBucket', skip_if_unchanged=True)
+
+
+def test_upload_file_to_s3_skip_if_unchanged_missing(tmp_path, s3_stubber):
+    file_to_upload = tmp_path / 'myFile.zip'
+    file_to_upload.touch()
+    s3_stubber.add_client_error(method='head_object', service_error_code='404', http_status_code=404)
+    s3_stubber.add_response(method='put_object', service_response={})
+    s3_stubber.add_response(method='put_object_tagging', service_response={})
+    aws.upload_file_to_s3(file_to_upload, 'myBucket', skip_if_unchanged=True)
+
+    s3_stubber.add_client_error(method='head_object', service_error_code='403', http_status_code=403)
+    with pytest.raises(ClientError):
+        aws.upload_file_to_s3(file_to_upload, 'myBucket', skip_if_unchanged=True)
@@ -1,12 +1,299 @@
 import json
+import os
+import threading
+import tracemalloc
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from unittest.mock import patch
 
+import numpy as np
 import pytest
+import responses
 from osgeo import gdal, ogr
 
 from hyp3lib import DemError, dem
 
 
+@pytest.fixture
+def local_dem_geojson(tmp_path, monkeypatch):
+    def tile(lon, lat):
+        return {
+            'type': 'Feature',
+            'properties': {'file_path': f'tile_{lon}_{lat}.tif'},
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': [[[lon, lat], [lon, lat + 1], [lon + 1, lat + 1], [lon + 1, lat], [lon, lat]]],
+            },
+        }
+
+    geojson = {'type': 'FeatureCollection', 'features': [tile(169, -46), tile(10, 20), tile(11, 20)]}
+    geojson_file = tmp_path / 'tiles.geojson'
+    geojson_file.write_text(json.dumps(geojson))
+    monkeypatch.setattr(dem, 'DEM_GEOJSON', str(geojson_file))
+    return geojson_file
+
+
+def test_dem_footprint_index(local_dem_geojson):
+    index = dem._get_dem_footprint_index(str(local_dem_geojson))
+    assert index is dem._get_dem_footprint_index(str(local_dem_geojson))
+
+    point = ogr.CreateGeometryFromJson(json.dumps({'type': 'Point', 'coordinates': [169.5, -45.5]}))
+    assert index.query(point) == ['tile_169_-46.tif']
+
+    point = ogr.CreateGeometryFromJson(json.dumps({'type': 'Point', 'coordinates': [0, 0]}))
+    assert index.query(point) == []
+
+    edge = ogr.CreateGeometryFromJson(json.dumps({'type': 'Point', 'coordinates': [11, 20.5]}))
+    assert index.query(edge) == ['tile_10_20.tif', 'tile_11_20.tif']
+
+    line = ogr.CreateGeometryFromJson(json.dumps({'type': 'LineString', 'coordinates': [[11.5, 20.5], [10.5, 20.5]]}))
+    assert index.query(line) == ['tile_10_20.tif', 'tile_11_20.tif']
+
+
+def test_intersects_dem_local(local_dem_geojson):
+    point = ogr.CreateGeometryFromJson(json.dumps({'type': 'Point', 'coordinates': [10.5, 20.5]}))
+    assert dem._intersects_dem(point)
+    assert dem._get_dem_file_paths(point) == ['tile_10_20.tif']
+
+    point = ogr.CreateGeometryFromJson(json.dumps({'type': 'Point', 'coordinates': [0, 0]}))
+    assert not dem._intersects_dem(point)
+    assert dem._get_dem_file_paths(point) == []
+
+
+@responses.activate
+def test_get_local_dem_geojson(tmp_path, monkeypatch):
+    url = 'https://foo.bar/tiles.geojson'
+    monkeypatch.setattr(dem, 'DEM_GEOJSON', f'/vsicurl/{url}')
+    monkeypatch.setenv('HYP3LIB_CACHE_DIR', str(tmp_path))
+    local_file = tmp_path / 'dem' / 'tiles.geojson'
+
+    responses.add(responses.HEAD, url, headers={'ETag': '"1"'})
+    download = responses.add(responses.GET, url, body='version 1')
+    assert dem._get_local_dem_geojson() == str(local_file)
+    assert dem._get_local_dem_geojson() == str(local_file)
+    assert local_file.read_text() == 'version 1'
+    assert download.call_count == 1
+
+    responses.replace(responses.HEAD, url, headers={'ETag': '"2"'})
+    responses.replace(responses.GET, url, body='version 2')
+    assert dem._get_local_dem_geojson() == str(local_file)
+    assert local_file.read_text() == 'version 2'
+
+    responses.replace(responses.HEAD, url, headers={'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+    responses.replace(responses.GET, url, body='version 3')
+    assert dem._get_local_dem_geojson() == str(local_file)
+    assert dem._get_local_dem_geojson() == str(local_file)
+    assert local_file.read_text() == 'version 3'
+    assert [call.request.method for call in responses.calls].count('GET') == 3
+
+    responses.replace(responses.HEAD, url)
+    responses.replace(responses.GET, url, body='version 4')
+    assert dem._get_local_dem_geojson() == str(local_file)
+    assert local_file.read_text() == 'version 4'
+    responses.replace(responses.GET, url, body='version 5')
+    assert dem._get_local_dem_geojson() == str(local_file)
+    assert local_file.read_text() == 'version 5'
+
+    responses.replace(responses.HEAD, url, status=404)
+    assert dem._get_local_dem_geojson() == str(local_file)
+
+
+@responses.activate
+def test_dem_tile_cache(tmp_path):
+    for name in ('a', 'b', 'c'):
+        responses.add(responses.GET, f'https://foo.bar/{name}.tif', body=name * 10)
+
+    cache = dem.DemTileCache(tmp_path / 'cache', max_size_in_bytes=20)
+    assert cache.get('local.tif') == 'local.tif'
+
+    tile_a = cache.get('/vsicurl/https://foo.bar/a.tif')
+    assert Path(tile_a).read_text() == 'a' * 10
+    assert Path(tile_a).parent == tmp_path / 'cache'
+    assert cache.get('/vsicurl/https://foo.bar/a.tif') == tile_a
+    assert (cache.hits, cache.misses, cache.bytes_saved) == (1, 1, 10)
+
+    os.utime(tile_a, (0, 0))
+    tile_b = cache.get('/vsicurl/https://foo.bar/b.tif')
+    tile_c = cache.get('/vsicurl/https://foo.bar/c.tif')
+    assert not Path(tile_a).exists()
+    assert Path(tile_b).exists()
+    assert Path(tile_c).exists()
+    assert (cache.hits, cache.misses, cache.bytes_saved) == (1, 3, 10)
+
+
+@responses.activate
+def test_dem_tile_cache_link_directory(tmp_path):
+    for name in ('a', 'b', 'c'):
+        responses.add(responses.GET, f'https://foo.bar/{name}.tif', body=name * 10)
+    cache = dem.DemTileCache(tmp_path / 'cache', max_size_in_bytes=20)
+    link_directory = tmp_path / 'links'
+    link_directory.mkdir()
+
+    tile_a = cache.get('/vsicurl/https://foo.bar/a.tif', link_directory=link_directory)
+    assert Path(tile_a).parent == link_directory
+    assert Path(tile_a).samefile(cache._get_cache_path('/vsicurl/https://foo.bar/a.tif'))
+    assert cache.get('/vsicurl/https://foo.bar/a.tif', link_directory=link_directory) == tile_a
+    assert (cache.hits, cache.misses, cache.bytes_saved) == (1, 1, 10)
+
+    os.utime(cache._get_cache_path('/vsicurl/https://foo.bar/a.tif'), (0, 0))
+    cache.get_many(['/vsicurl/https://foo.bar/b.tif', '/vsicurl/https://foo.bar/c.tif'], max_workers=1)
+    assert not cache._get_cache_path('/vsicurl/https://foo.bar/a.tif').exists()
+    assert Path(tile_a).read_text() == 'a' * 10
+
+    with patch('os.link', side_effect=OSError('Invalid cross-device link')):
+        tile_b = cache.get('/vsicurl/https://foo.bar/b.tif', link_directory=link_directory)
+    assert Path(tile_b).read_text() == 'b' * 10
+    assert not Path(tile_b).samefile(cache._get_cache_path('/vsicurl/https://foo.bar/b.tif'))
+
+
+@pytest.fixture
+def local_http_server(tmp_path):
+    served_dir = tmp_path / 'served'
+    served_dir.mkdir()
+    handler = partial(SimpleHTTPRequestHandler, directory=str(served_dir))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield served_dir, f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    thread.join()
+
+
+def test_dem_tile_cache_get_many(tmp_path, local_http_server):
+    served_dir, base_url = local_http_server
+    file_paths = []
+    for ii in range(24):
+        (served_dir / f'tile_{ii}.tif').write_text(f'tile {ii}')
+        file_paths.append(f'/vsicurl/{base_url}/tile_{ii}.tif')
+
+    cache = dem.DemTileCache(tmp_path / 'cache')
+    local_paths = cache.get_many(file_paths + ['local.tif'], max_workers=4)
+
+    assert local_paths[-1] == 'local.tif'
+    assert [Path(local_path).read_text() for local_path in local_paths[:-1]] == [f'tile {ii}' for ii in range(24)]
+    assert (cache.hits, cache.misses) == (0, 24)
+
+    assert cache.get_many(file_paths, max_workers=4) == local_paths[:-1]
+    assert (cache.hits, cache.misses) == (24, 24)
+
+
+def test_get_default_tile_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv('HYP3LIB_DEM_TILE_CACHE_DIR', raising=False)
+    assert dem._get_default_tile_cache() is None
+
+    monkeypatch.setenv('HYP3LIB_DEM_TILE_CACHE_DIR', str(tmp_path))
+    monkeypatch.setenv('HYP3LIB_DEM_TILE_CACHE_MAX_GB', '0.5')
+    cache = dem._get_default_tile_cache()
+    assert cache is not None
+    assert cache is dem._get_default_tile_cache()
+    assert cache.directory == tmp_path
+    assert cache.max_size_in_bytes == 2**29
+
+
+def test_get_geoid_grid(tmp_path, monkeypatch):
+    monkeypatch.delenv('HYP3LIB_GEOID_CACHE_DIR', raising=False)
+    monkeypatch.setenv('HYP3LIB_CACHE_DIR', str(tmp_path / 'cache'))
+    job_dir = tmp_path / 'job'
+    job_dir.mkdir()
+
+    def warp(destination, *args, **kwargs):
+        Path(destination).write_text('geoid')
+
+    with patch('hyp3lib.dem.gdal.Warp', side_effect=warp) as mock_warp:
+        geoid_file = dem._get_geoid_grid('wkt', [0.0, 0.0, 1.0, 1.0], 10, 10, job_dir)
+        assert geoid_file.is_relative_to(job_dir)
+        assert geoid_file.read_text() == 'geoid'
+        assert dem._get_geoid_grid('wkt', [0.0, 0.0, 1.0, 1.0], 10, 10, job_dir) != geoid_file
+        assert mock_warp.call_count == 2
+        assert not (tmp_path / 'cache').exists()
+
+
+def test_get_geoid_grid_cached(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'geoid'
+    monkeypatch.setenv('HYP3LIB_GEOID_CACHE_DIR', str(cache_dir))
+    job_dir = tmp_path / 'job'
+    job_dir.mkdir()
+
+    def warp(destination, *args, **kwargs):
+        Path(destination).write_text('geoid')
+
+    with patch('hyp3lib.dem.gdal.Warp', side_effect=warp) as mock_warp:
+        geoid_file = dem._get_geoid_grid('wkt', [0.0, 0.0, 1.0, 1.0], 10, 10, job_dir)
+        assert geoid_file.is_relative_to(job_dir)
+        assert (cache_dir / geoid_file.name).exists()
+
+        other_file = dem._get_geoid_grid('wkt', [0.0, 0.0, 1.0, 1.0], 10, 10, job_dir)
+        assert other_file != geoid_file
+        assert other_file.name == geoid_file.name
+        assert mock_warp.call_count == 1
+
+        # links stay readable after the cached grid is evicted
+        (cache_dir / geoid_file.name).unlink()
+        assert geoid_file.read_text() == 'geoid'
+        assert other_file.read_text() == 'geoid'
+
+        assert dem._get_geoid_grid('wkt', [0.0, 0.0, 1.0, 1.0], 20, 20, job_dir).name != geoid_file.name
+        assert dem._get_geoid_grid('other wkt', [0.0, 0.0, 1.0, 1.0], 10, 10, job_dir).name != geoid_file.name
+        assert dem._get_geoid_grid('wkt', [0.0, 0.0, 2.0, 1.0], 10, 10, job_dir).name != geoid_file.name
+        assert mock_warp.call_count == 4
+
+
+@pytest.mark.parametrize('size', [1024, 4096])
+def test_convert_to_height_above_ellipsoid(tmp_path, size):
+    def create_geotiff(path, value, creation_options):
+        ds = gdal.GetDriverByName('GTiff').Create(str(path), size, size, 1, gdal.GDT_Float32, creation_options)
+        ds.SetGeoTransform([500000.0, 30.0, 0.0, 4000000.0, 0.0, -30.0])
+        ds.SetProjection('EPSG:32611')
+        ds.GetRasterBand(1).Fill(value)
+        del ds
+
+    dem_file = tmp_path / 'dem.tif'
+    geoid_file = tmp_path / 'geoid.tif'
+    create_geotiff(dem_file, 100.0, ['TILED=YES'])
+    create_geotiff(geoid_file, -20.0, [])
+
+    with patch('hyp3lib.dem._get_geoid_grid', return_value=geoid_file):
+        tracemalloc.start()
+        dem._convert_to_height_above_ellipsoid(dem_file, tmp_path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    # peak memory is a few 256x256 float32 blocks regardless of the size of the DEM
+    assert peak < 2**20
+
+    ds = gdal.Open(str(dem_file))
+    assert ds.GetRasterBand(1).ComputeRasterMinMax() == (80.0, 80.0)
+
+
+def test_warp_dem_in_chunks(tmp_path):
+    source = tmp_path / 'source.tif'
+    ds = gdal.GetDriverByName('GTiff').Create(str(source), 720, 720, 1, gdal.GDT_Float32)
+    ds.SetGeoTransform([0.4, 1 / 3600, 0.0, 10.4, 0.0, -1 / 3600])
+    ds.SetProjection('EPSG:4326')
+    ds.SetMetadataItem('AREA_OR_POINT', 'Point')
+    x, y = np.meshgrid(np.arange(720), np.arange(720))
+    ds.GetRasterBand(1).WriteArray(np.sin(x / 50) * np.cos(y / 70) * 1000)
+    del ds
+
+    geojson = {
+        'type': 'Polygon',
+        'coordinates': [[[0.45, 10.25], [0.45, 10.35], [0.55, 10.35], [0.55, 10.25], [0.45, 10.25]]],
+    }
+    geometry = ogr.CreateGeometryFromJson(json.dumps(geojson))
+
+    dem._warp_dem(tmp_path / 'single.tif', source, geometry, 32631, 30)
+    dem._warp_dem_in_chunks(tmp_path / 'chunked.tif', source, geometry, 32631, 30, chunk_size=100)
+
+    single_ds = gdal.Open(str(tmp_path / 'single.tif'))
+    chunked_ds = gdal.Open(str(tmp_path / 'chunked.tif'))
+    assert chunked_ds.GetGeoTransform() == single_ds.GetGeoTransform()
+    assert chunked_ds.RasterXSize == single_ds.RasterXSize
+    assert chunked_ds.RasterYSize == single_ds.RasterYSize
+    assert chunked_ds.GetMetadataItem('AREA_OR_POINT') == 'Point'
+    assert np.allclose(chunked_ds.ReadAsArray(), single_ds.ReadAsArray(), atol=1e-3)
+
+
 def test_intersects_dem():
     geojson = {
         'type': 'Point',
@@ -92,6 +379,93 @@ def test_prepare_dem_geotiff(tmp_path):
     assert info['size'] == [377, 1289]
 
 
+def test_prepare_dem_geotiffs(tmp_path):
+    def polygon(minx, miny, maxx, maxy):
+        geojson = {
+            'type': 'Polygon',
+            'coordinates': [[[minx, miny], [minx, maxy], [maxx, maxy], [maxx, miny], [minx, miny]]],
+        }
+        return ogr.CreateGeometryFromJson(json.dumps(geojson))
+
+    geometries = [polygon(0.4, 10.16, 0.6, 10.86), polygon(0.5, 10.5, 1.2, 10.9)]
+    dem_requests = [(tmp_path / f'batch_{ii}.tif', geometry, 32631, 60) for ii, geometry in enumerate(geometries)]
+
+    with patch.object(dem.DemTileCache, 'get_many', autospec=True, side_effect=dem.DemTileCache.get_many) as get_many:
+        output_names = dem.prepare_dem_geotiffs(dem_requests, max_workers=2)
+    assert output_names == [tmp_path / 'batch_0.tif', tmp_path / 'batch_1.tif']
+    get_many.assert_called_once()
+
+    for ii, geometry in enumerate(geometries):
+        single = dem.prepare_dem_geotiff(tmp_path / f'single_{ii}.tif', geometry, epsg_code=32631, pixel_size=60)
+        assert single.read_bytes() == output_names[ii].read_bytes()
+
+    chunked_requests = [(tmp_path / f'chunked_{ii}.tif', geometry, 32631, 60) for ii, geometry in enumerate(geometries)]
+    with patch('hyp3lib.dem._get_chunk_executor', wraps=dem._get_chunk_executor) as get_chunk_executor:
+        chunked_names = dem.prepare_dem_geotiffs(chunked_requests, max_workers=2, chunk_size=256, chunk_workers=2)
+    get_chunk_executor.assert_called_once_with(2)
+    for chunked_name, output_name in zip(chunked_names, output_names):
+        chunked = gdal.Open(str(chunked_name)).ReadAsArray()
+        assert np.allclose(chunked, gdal.Open(str(output_name)).ReadAsArray(), atol=1e-3)
+
+    with pytest.raises(DemError):
+        dem.prepare_dem_geotiffs([(tmp_path / 'foo.tif', polygon(-0.1, -0.1, 0.1, 0.1), 32631, 60)])
+
+
+def test_prepare_dem_geotiff_single_pass(tmp_path):
+    geojson = {
+        'type': 'Polygon',
+        'coordinates': [[[0.4, 10.16], [0.4, 10.36], [0.6, 10.36], [0.6, 10.16], [0.4, 10.16]]],
+    }
+    geometry = ogr.CreateGeometryFromJson(json.dumps(geojson))
+
+    two_pass = dem.prepare_dem_geotiff(
+        tmp_path / 'two_pass.tif', geometry, epsg_code=32631, pixel_size=60, height_above_ellipsoid=True
+    )
+    single_pass = dem.prepare_dem_geotiff(
+        tmp_path / 'single_pass.tif',
+        geometry,
+        epsg_code=32631,
+        pixel_size=60,
+        height_above_ellipsoid=True,
+        single_pass=True,
+    )
+
+    two_pass_ds = gdal.Open(str(two_pass))
+    single_pass_ds = gdal.Open(str(single_pass))
+    assert single_pass_ds.GetGeoTransform() == two_pass_ds.GetGeoTransform()
+    assert single_pass_ds.GetMetadataItem('AREA_OR_POINT') == two_pass_ds.GetMetadataItem('AREA_OR_POINT')
+    assert (single_pass_ds.ReadAsArray() == two_pass_ds.ReadAsArray()).all()
+
+
+def test_prepare_dem_geotiff_cog(tmp_path):
+    geojson = {
+        'type': 'Polygon',
+        'coordinates': [[[0.4, 10.16], [0.4, 10.86], [0.6, 10.86], [0.6, 10.16], [0.4, 10.16]]],
+    }
+    geometry = ogr.CreateGeometryFromJson(json.dumps(geojson))
+
+    geotiff = dem.prepare_dem_geotiff(tmp_path / 'dem.tif', geometry, epsg_code=32631, pixel_size=60)
+    cog = dem.prepare_dem_geotiff(
+        tmp_path / 'cog.tif',
+        geometry,
+        epsg_code=32631,
+        pixel_size=60,
+        cog=dem.CogOptions(block_size=256, overviews=True),
+        warp_memory_limit=256,
+    )
+
+    info = gdal.Info(str(cog), format='json')
+    assert info['geoTransform'] == [215040.0, 60.0, 0.0, 1201560.0, 0.0, -60.0]
+    assert info['size'] == [377, 1289]
+    assert info['metadata']['IMAGE_STRUCTURE']['LAYOUT'] == 'COG'
+    assert info['metadata']['IMAGE_STRUCTURE']['COMPRESSION'] == 'DEFLATE'
+    assert info['metadata']['IMAGE_STRUCTURE']['PREDICTOR'] == '3'
+    assert info['bands'][0]['block'] == [256, 256]
+    assert len(info['bands'][0]['overviews']) > 0
+
+    assert (gdal.Open(str(cog)).ReadAsArray() == gdal.Open(str(geotiff)).ReadAsArray()).all()
+
+
 def test_prepare_dem_geotiff_antimeridian(tmp_path):
     dem_geotiff = tmp_path / 'dem.tif'
     geojson = {
@@ -1,9 +1,18 @@
+import base64
+import hashlib
 import os
+import threading
+import time
 from pathlib import Path
+from typing import cast
+from unittest.mock import patch
+from urllib.parse import urlparse
 
 import pytest
 import requests
 import responses
+from lxml import etree
+from requests.adapters import HTTPAdapter
 
 from hyp3lib import fetch
 
@@ -66,6 +75,66 @@ def test_get_download_path():
         fetch._get_download_path('https://foo.com')
 
 
+def test_get_session():
+    session = fetch.get_session()
+    assert fetch.get_session() is session
+    assert fetch.get_session(retries=2, backoff_factor=1) is session
+    adapter = session.get_adapter('https://foo.com')
+    assert isinstance(adapter, HTTPAdapter)
+    assert adapter.max_retries.total == 2
+
+    other_session = fetch.get_session(retries=3, backoff_factor=10)
+    assert other_session is not session
+    other_adapter = other_session.get_adapter('http://foo.com')
+    assert isinstance(other_adapter, HTTPAdapter)
+    assert other_adapter.max_retries.total == 3
+    assert other_adapter.max_retries.backoff_factor == 10
+
+    fetch.configure_session_pool(pool_connections=4, pool_maxsize=32)
+    try:
+        new_session = fetch.get_session()
+        assert new_session is not session
+        new_adapter = new_session.get_adapter('https://foo.com')
+        assert isinstance(new_adapter, HTTPAdapter)
+        assert new_adapter.poolmanager.pools._maxsize == 4
+        assert new_adapter.poolmanager.connection_pool_kw['maxsize'] == 32
+    finally:
+        fetch.configure_session_pool()
+
+
+@responses.activate
+def test_download_file_shared_session(tmp_path):
+    responses.add(responses.GET, 'http://hyp3.asf.alaska.edu/foo.txt', body='foo')
+    responses.add(responses.GET, 'http://hyp3.asf.alaska.edu/bar.txt', body='bar')
+
+    with patch('hyp3lib.fetch.get_session', wraps=fetch.get_session) as mock_get_session:
+        fetch.download_file('http://hyp3.asf.alaska.edu/foo.txt', directory=tmp_path, token='my-token')
+        fetch.download_file('http://hyp3.asf.alaska.edu/bar.txt', directory=tmp_path)
+
+    assert mock_get_session.call_count == 2
+    assert responses.calls[0].request.headers['Authorization'] == 'Bearer my-token'
+    assert 'Authorization' not in responses.calls[1].request.headers
+    assert 'Authorization' not in fetch.get_session().headers
+
+
+@responses.activate
+def test_download_file_shared_session_cookies(tmp_path):
+    responses.add(
+        responses.GET,
+        'http://hyp3.asf.alaska.edu/foo.txt',
+        status=302,
+        headers={'Location': 'http://hyp3.asf.alaska.edu/bar.txt', 'Set-Cookie': 'session=foo; Path=/'},
+    )
+    responses.add(responses.GET, 'http://hyp3.asf.alaska.edu/bar.txt', body='bar')
+
+    fetch.download_file('http://hyp3.asf.alaska.edu/foo.txt', directory=tmp_path)
+    assert responses.calls[1].request.headers['Cookie'] == 'session=foo'
+
+    fetch.download_file('http://hyp3.asf.alaska.edu/bar.txt', directory=tmp_path)
+    assert 'Cookie' not in responses.calls[2].request.headers
+    assert not fetch.get_session().cookies
+
+
 @responses.activate
 def test_download_file(safe_data, tmp_path):
     with open(os.path.join(safe_data, 'granule_name.txt')) as f:
@@ -125,3 +194,472 @@ def test_download_file_auth(tmp_path):
 def test_download_file_none():
     with pytest.raises(requests.exceptions.MissingSchema):
         _ = fetch.download_file(url=None)  # type: ignore [arg-type]
+
+
+_ETAG = '"version1"'
+
+
+def _range_request_callback(body, etag=_ETAG):
+    def callback(request):
+        if 'If-Range' in request.headers and request.headers['If-Range'] != etag:
+            return 200, {'ETag': etag}, body
+        start, end = request.headers['Range'].removeprefix('bytes=').split('-')
+        start, end = int(start), int(end) if end else len(body) - 1
+        if start >= len(body):
+            return 416, {'Content-Range': f'bytes */{len(body)}', 'ETag': etag}, b''
+        return 206, {'Content-Range': f'bytes {start}-{end}/{len(body)}', 'ETag': etag}, body[start : end + 1]
+
+    return callback
+
+
+@responses.activate
+def test_download_file_in_segments(tmp_path):
+    body = bytes(range(256)) * 100
+    url = 'http://hyp3.asf.alaska.edu/foobar.bin'
+    responses.add(responses.HEAD, url, headers={'Accept-Ranges': 'bytes', 'Content-Length': str(len(body))})
+    responses.add_callback(responses.GET, url, callback=_range_request_callback(body))
+
+    download_path = fetch.download_file(url, directory=tmp_path, segments=7)
+
+    assert download_path == os.path.join(tmp_path, 'foobar.bin')
+    with open(download_path, 'rb') as f:
+        assert f.read() == body
+    assert len([call for call in responses.calls if call.request.method == 'GET']) == 7
+
+
+@responses.activate
+def test_download_file_in_segments_short_segment(tmp_path):
+    body = bytes(range(256)) * 100
+    url = 'http://hyp3.asf.alaska.edu/foobar.bin'
+    responses.add(
+        responses.HEAD, url, headers={'Accept-Ranges': 'bytes', 'Content-Length': str(len(body)), 'ETag': _ETAG}
+    )
+    dropped: list[object] = []
+
+    def callback(request):
+        status, headers, content = _range_request_callback(body)(request)
+        if request.headers['Range'] == 'bytes=0-12799' and not dropped:
+            dropped.append(request)
+            return status, headers, content[:1000]
+        return status, headers, content
+
+    responses.add_callback(responses.GET, url, callback=callback)
+
+    with patch('hyp3lib.fetch.time.sleep'):
+        download_path = fetch.download_file(url, directory=tmp_path, segments=2)
+
+    assert Path(download_path).read_bytes() == body
+    assert [call.request.headers['If-Range'] for call in responses.calls[1:]] == [_ETAG] * 3
+    assert 'bytes=1000-12799' in [call.request.headers['Range'] for call in responses.calls[1:]]
+
+
+@responses.activate
+def test_download_file_in_segments_failure(tmp_path):
+    body = bytes(range(256)) * 100
+    url = 'http://hyp3.asf.alaska.edu/foobar.bin'
+    responses.add(responses.HEAD, url, headers={'Accept-Ranges': 'bytes', 'Content-Length': str(len(body))})
+
+    def wrong_range(request):
+        return 206, {'Content-Range': f'bytes 0-99/{len(body)}'}, body[:100]
+
+    responses.add_callback(responses.GET, url, callback=wrong_range)
+    with pytest.raises(requests.HTTPError, match='Content-Range'):
+        fetch.download_file(url, directory=tmp_path, segments=2)
+    assert list(tmp_path.iterdir()) == []
+
+    responses.replace(responses.GET, url, status=404)
+    with pytest.raises(requests.HTTPError):
+        fetch.download_file(url, directory=tmp_path, segments=2)
+    assert list(tmp_path.iterdir()) == []
+
+
+@responses.activate
+def test_download_file_in_segments_fallback(tmp_path):
+    url = 'http://hyp3.asf.alaska.edu/foobar.txt'
+    responses.add(responses.HEAD, url)
+    responses.add(responses.GET, url, body='content')
+
+    download_path = fetch.download_file(url, directory=tmp_path, segments=4)
+
+    with open(download_path) as f:
+        assert f.read() == 'content'
+    assert len([call for call in responses.calls if call.request.method == 'GET']) == 1
+
+
+@responses.activate
+def test_download_file_resume_part_file(tmp_path):
+    body = b'0123456789' * 10
+    url = 'http://hyp3.asf.alaska.edu/foobar.bin'
+    (tmp_path / 'foobar.bin.part').write_bytes(body[:42])
+    (tmp_path / 'foobar.bin.part.validator').write_text(_ETAG)
+
+    def callback(request):
+        if 'Range' in request.headers:
+            return _range_request_callback(body)(request)
+        return 200, {'ETag': _ETAG}, body
+
+    responses.add_callback(responses.GET, url, callback=callback)
+
+    download_path = fetch.download_file(url, directory=tmp_path)
+
+    assert (tmp_path / 'foobar.bin').read_bytes() == body
+    assert not (tmp_path / 'foobar.bin.part').exists()
+    assert not (tmp_path / 'foobar.bin.part.validator').exists()
+    assert download_path == os.path.join(tmp_path, 'foobar.bin')
+    assert responses.calls[-1].request.headers['Range'] == 'bytes=42-'
+    assert responses.calls[-1].request.headers['If-Range'] == _ETAG
+
+
+@responses.activate
+def test_download_file_discard_part_file(tmp_path):
+    body = bytes(range(256)) * 100
+    url = 'http://hyp3.asf.alaska.edu/foobar.bin'
+
+    def callback(request):
+        if 'Range' in request.headers:
+            return _range_request_callback(body)(request)
+        return 200, {'ETag': _ETAG}, body
+
+    responses.add_callback(responses.GET, url, callback=callback)
+
+    # Preallocated by a failed segmented download, so there's no validator
+    (tmp_path / 'foobar.bin.part').write_bytes(body[:6375] + bytes(len(body) - 6375))
+    fetch.download_file(url, directory=tmp_path)
+    assert (tmp_path / 'foobar.bin').read_bytes() == body
+    assert len(responses.calls) == 1
+
+    # Left by a download of a different version of the file
+    (tmp_path / 'foobar.bin.part').write_bytes(b'old version')
+    (tmp_path / 'foobar.bin.part.validator').write_text('"version0"')
+    fetch.download_file(url, directory=tmp_path)
+    assert (tmp_path / 'foobar.bin').read_bytes() == body
+    assert len(responses.calls) == 2
+
+    # Larger than the file, so the server rejects the range request
+    (tmp_path / 'foobar.bin.part').write_bytes(body + b'extra')
+    (tmp_path / 'foobar.bin.part.validator').write_text(_ETAG)
+    fetch.download_file(url, directory=tmp_path)
+    assert (tmp_path / 'foobar.bin').read_bytes() == body
+    # responses annotates recorded responses with its own Response type, but they are requests Responses
+    statuses = [cast(requests.Response, call.response).status_code for call in responses.calls[2:]]
+    assert statuses == [200, 416, 200]
+    assert not (tmp_path / 'foobar.bin.part').exists()
+    assert not (tmp_path / 'foobar.bin.part.validator').exists()
+
+
+@responses.activate
+def test_download_file_resume_changed_file(tmp_path):
+    old_body = b'0123456789' * 10
+    new_body = b'abcdefghij' * 12
+    url = 'http://hyp3.asf.alaska.edu/foobar.bin'
+    responses.add(
+        responses.GET,
+        url,
+        body=old_body[:30],
+        headers={'Content-Length': str(len(old_body)), 'ETag': _ETAG},
+        auto_calculate_content_length=False,
+    )
+    responses.add_callback(responses.GET, url, callback=_range_request_callback(new_body, etag='"version2"'))
+
+    with patch('hyp3lib.fetch.time.sleep'):
+        fetch.download_file(url, directory=tmp_path)
+
+    assert (tmp_path / 'foobar.bin').read_bytes() == new_body
+    assert responses.calls[1].request.headers['If-Range'] == _ETAG
+
+
+@responses.activate
+def test_download_file_resume_dropped_connection(tmp_path):
+    body = b'0123456789' * 10
+    url = 'http://hyp3.asf.alaska.edu/foobar.bin'
+
+    def callback(request):
+        if 'Range' in request.headers:
+            return _range_request_callback(body)(request)
+        return 200, {'Content-Length': str(len(body)), 'ETag': _ETAG}, body[:30]
+
+    responses.add_callback(responses.GET, url, callback=callback)
+
+    with patch('hyp3lib.fetch.time.sleep'):
+        fetch.download_file(url, directory=tmp_path)
+
+    assert (tmp_path / 'foobar.bin').read_bytes() == body
+    assert not (tmp_path / 'foobar.bin.part').exists()
+    assert responses.calls[-1].request.headers['Range'] == 'bytes=30-'
+
+
+@responses.activate
+def test_download_file_stats(tmp_path):
+    body = b'0123456789' * 10
+    url = 'http://hyp3.asf.alaska.edu/foobar.bin'
+
+    def callback(request):
+        if 'Range' in request.headers:
+            return _range_request_callback(body)(request)
+        return 200, {'Content-Length': str(len(body)), 'ETag': _ETAG}, body[:30]
+
+    responses.add_callback(responses.GET, url, callback=callback)
+
+    stats: list[fetch.DownloadStats] = []
+    with patch('hyp3lib.fetch.time.sleep'):
+        fetch.download_file(url, directory=tmp_path, chunk_size=7, stats_callback=stats.append)
+
+    assert (tmp_path / 'foobar.bin').read_bytes() == body
+    assert len(stats) == 1
+    assert stats[0].url == url
+    assert stats[0].bytes_downloaded == 100
+    assert stats[0].retries == 1
+    assert stats[0].time_to_first_byte is not None
+    assert 0 <= stats[0].time_to_first_byte <= stats[0].elapsed_time
+    assert 0 <= stats[0].write_stall_time <= stats[0].elapsed_time
+    assert stats[0].throughput > 0
+
+    assert fetch.DownloadStats('foo', 10, 0.0, None, 0, 0.0).throughput == 0.0
+    assert fetch.DownloadStats('foo', 10, 2.0, None, 0, 0.0).throughput == 5.0
+
+
+@responses.activate
+def test_download_file_resume_gives_up(tmp_path):
+    url = 'http://hyp3.asf.alaska.edu/foobar.bin'
+    responses.add(
+        responses.GET, url, body=b'short', headers={'Content-Length': '100'}, auto_calculate_content_length=False
+    )
+
+    with patch('hyp3lib.fetch.time.sleep'), pytest.raises(requests.exceptions.RequestException):
+        fetch.download_file(url, directory=tmp_path, retries=1)
+
+    assert not (tmp_path / 'foobar.bin').exists()
+
+
+@responses.activate
+def test_download_files(tmp_path):
+    responses.add(responses.GET, 'http://hyp3.asf.alaska.edu/foo.txt', body='foo')
+    responses.add(responses.GET, 'http://hyp3.asf.alaska.edu/bar.txt', body='barbar')
+    responses.add(responses.GET, 'http://other.host.com/missing.txt', status=404)
+    progress = []
+
+    results = fetch.download_files(
+        [
+            'http://hyp3.asf.alaska.edu/foo.txt',
+            'http://other.host.com/missing.txt',
+            'http://hyp3.asf.alaska.edu/bar.txt',
+        ],
+        directory=tmp_path,
+        max_concurrency=2,
+        max_per_host=1,
+        progress_callback=lambda *args: progress.append(args),
+        retries=0,
+    )
+
+    assert list(results) == [
+        'http://hyp3.asf.alaska.edu/foo.txt',
+        'http://other.host.com/missing.txt',
+        'http://hyp3.asf.alaska.edu/bar.txt',
+    ]
+    assert results['http://hyp3.asf.alaska.edu/foo.txt'] == str(tmp_path / 'foo.txt')
+    assert results['http://hyp3.asf.alaska.edu/bar.txt'] == str(tmp_path / 'bar.txt')
+    assert isinstance(results['http://other.host.com/missing.txt'], requests.HTTPError)
+    assert (tmp_path / 'bar.txt').read_text() == 'barbar'
+
+    assert [completed for completed, _, _ in progress] == [1, 2, 3]
+    assert all(total == 3 for _, total, _ in progress)
+    assert progress[-1][2] == 9
+
+
+@responses.activate
+def test_download_files_per_host_scheduling(tmp_path):
+    lock = threading.Lock()
+    running: dict[str, int] = {}
+    peaks: dict[str, int] = {}
+
+    def callback(request):
+        host = urlparse(request.url).netloc
+        with lock:
+            running[host] = running.get(host, 0) + 1
+            peaks[host] = max(peaks.get(host, 0), running[host])
+        time.sleep(0.3)
+        with lock:
+            running[host] -= 1
+        return 200, {}, b'foo'
+
+    urls = [f'http://{host}/{host}_{ii}.txt' for host in ('foo.com', 'bar.com') for ii in range(6)]
+    for url in urls:
+        responses.add_callback(responses.GET, url, callback=callback)
+
+    start = time.perf_counter()
+    results = fetch.download_files(urls, directory=tmp_path, max_concurrency=4, max_per_host=2)
+
+    # Three rounds of two downloads from each host at once; a worker waiting on a busy host would take five
+    assert time.perf_counter() - start < 1.3
+    assert peaks == {'foo.com': 2, 'bar.com': 2}
+    assert all(isinstance(result, str) for result in results.values())
+
+
+@responses.activate
+def test_download_files_same_file_name(tmp_path):
+    responses.add(responses.GET, 'http://hyp3.asf.alaska.edu/foo.txt', body='foo')
+
+    results = fetch.download_files(
+        ['http://hyp3.asf.alaska.edu/foo.txt', 'http://other.host.com/foo.txt', 'http://other.host.com/'],
+        directory=tmp_path,
+    )
+
+    assert results['http://hyp3.asf.alaska.edu/foo.txt'] == str(tmp_path / 'foo.txt')
+    assert isinstance(results['http://other.host.com/foo.txt'], ValueError)
+    assert isinstance(results['http://other.host.com/'], ValueError)
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_download_file_with_checksum(tmp_path):
+    url = 'http://hyp3.asf.alaska.edu/foobar.txt'
+    responses.add(responses.GET, url, body='content')
+    sha256 = hashlib.sha256(b'content').hexdigest()
+
+    download_path, checksum = fetch.download_file_with_checksum(url, directory=tmp_path)
+    assert download_path == str(tmp_path / 'foobar.txt')
+    assert checksum == sha256
+
+    download_path, checksum = fetch.download_file_with_checksum(
+        url, directory=tmp_path, checksum_algorithm='md5', expected_checksum=hashlib.md5(b'content').hexdigest().upper()
+    )
+    assert checksum == hashlib.md5(b'content').hexdigest()
+
+
+@responses.activate
+def test_download_file_with_checksum_resume(tmp_path):
+    body = b'0123456789' * 10
+    url = 'http://hyp3.asf.alaska.edu/foobar.bin'
+    (tmp_path / 'foobar.bin.part').write_bytes(body[:42])
+    (tmp_path / 'foobar.bin.part.validator').write_text(_ETAG)
+
+    def callback(request):
+        if 'Range' in request.headers:
+            return _range_request_callback(body)(request)
+        return 200, {'ETag': _ETAG}, body
+
+    responses.add_callback(responses.GET, url, callback=callback)
+
+    _, checksum = fetch.download_file_with_checksum(
+        url, directory=tmp_path, expected_checksum=hashlib.sha256(body).hexdigest()
+    )
+    assert checksum == hashlib.sha256(body).hexdigest()
+
+
+@responses.activate
+def test_download_file_with_checksum_server_header(tmp_path):
+    url = 'http://hyp3.asf.alaska.edu/foobar.txt'
+    content_md5 = base64.b64encode(hashlib.md5(b'content').digest()).decode()
+    bad_md5 = base64.b64encode(hashlib.md5(b'corrupted').digest()).decode()
+    responses.add(responses.GET, url, body='content', headers={'Content-MD5': bad_md5})
+    responses.add(responses.GET, url, body='content', headers={'Content-MD5': content_md5})
+
+    with patch('hyp3lib.fetch.time.sleep'):
+        _, checksum = fetch.download_file_with_checksum(url, directory=tmp_path, checksum_algorithm='md5')
+    assert checksum == hashlib.md5(b'content').hexdigest()
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_download_file_with_checksum_mismatch(tmp_path):
+    url = 'http://hyp3.asf.alaska.edu/foobar.txt'
+    responses.add(responses.GET, url, body='content')
+
+    with patch('hyp3lib.fetch.time.sleep'), pytest.raises(requests.exceptions.RequestException, match='checksum'):
+        fetch.download_file_with_checksum(url, directory=tmp_path, expected_checksum='0' * 64, retries=1)
+
+    assert len(responses.calls) == 2
+    assert not (tmp_path / 'foobar.txt').exists()
+
+
+def test_get_server_checksum():
+    md5 = hashlib.md5(b'content')
+    sha256 = hashlib.sha256(b'content')
+    headers = requests.structures.CaseInsensitiveDict(
+        {
+            'Content-MD5': base64.b64encode(md5.digest()).decode(),
+            'x-amz-checksum-sha256': base64.b64encode(sha256.digest()).decode(),
+            'x-goog-hash': 'crc32c=n03x6A==, md5=AAAAAAAAAAAAAAAAAAAAAA==',
+        }
+    )
+    assert fetch._get_server_checksum(headers, 'sha256') == sha256.hexdigest()
+    assert fetch._get_server_checksum(headers, 'md5') == '0' * 32
+    assert fetch._get_server_checksum(headers, 'crc32c') == '9f4df1e8'
+    assert fetch._get_server_checksum({}, 'md5') is None
+
+
+@responses.activate
+def test_download_to_memory(tmp_path):
+    responses.add(responses.GET, 'http://hyp3.asf.alaska.edu/foobar.txt', body='content')
+
+    assert fetch.download_to_memory('http://hyp3.asf.alaska.edu/foobar.txt') == b'content'
+    assert list(tmp_path.iterdir()) == []
+
+
+@responses.activate
+def test_download_to_consumer():
+    body = b'<orbit><osv>1</osv><osv>2</osv></orbit>'
+    url = 'http://hyp3.asf.alaska.edu/foobar.EOF'
+
+    def callback(request):
+        if 'Range' in request.headers:
+            return _range_request_callback(body)(request)
+        return 200, {'Content-Length': str(len(body)), 'ETag': _ETAG}, body[:16]
+
+    responses.add_callback(responses.GET, url, callback=callback)
+    parser = etree.XMLPullParser()
+
+    with patch('hyp3lib.fetch.time.sleep'):
+        size = fetch.download_to_consumer(url, parser.feed, chunk_size=4)
+
+    assert size == len(body)
+    root = parser.close()
+    assert [osv.text for osv in root.findall('osv')] == ['1', '2']
+    assert responses.calls[-1].request.headers['Range'] == 'bytes=16-'
+    assert responses.calls[-1].request.headers['If-Range'] == _ETAG
+
+
+@responses.activate
+def test_download_to_consumer_changed_file():
+    url = 'http://hyp3.asf.alaska.edu/foobar.txt'
+    old_body, new_body = b'a' * 100, b'b' * 100
+
+    def callback(request):
+        if 'Range' in request.headers:
+            return _range_request_callback(new_body, etag='"version2"')(request)
+        return 200, {'Content-Length': str(len(old_body)), 'ETag': _ETAG}, old_body[:40]
+
+    responses.add_callback(responses.GET, url, callback=callback)
+
+    with patch('hyp3lib.fetch.time.sleep'), pytest.raises(requests.exceptions.RequestException, match='changed'):
+        fetch.download_to_memory(url)
+    assert responses.calls[-1].request.headers['If-Range'] == _ETAG
+
+
+@responses.activate
+def test_download_to_consumer_unexpected_range():
+    url = 'http://hyp3.asf.alaska.edu/foobar.txt'
+    body = b'a' * 100
+
+    def callback(request):
+        if 'Range' in request.headers:
+            return 206, {'Content-Range': f'bytes 0-99/{len(body)}', 'ETag': _ETAG}, body
+        return 200, {'Content-Length': str(len(body)), 'ETag': _ETAG}, body[:40]
+
+    responses.add_callback(responses.GET, url, callback=callback)
+    chunks: list[bytes] = []
+
+    with patch('hyp3lib.fetch.time.sleep'), pytest.raises(requests.exceptions.RequestException):
+        fetch.download_to_consumer(url, chunks.append)
+    assert b''.join(chunks) == body[:40]
+
+
+@responses.activate
+def test_download_to_consumer_not_resumable():
+    url = 'http://hyp3.asf.alaska.edu/foobar.txt'
+    responses.add(
+        responses.GET, url, body=b'short', headers={'Content-Length': '100'}, auto_calculate_content_length=False
+    )
+
+    with patch('hyp3lib.fetch.time.sleep'), pytest.raises(requests.exceptions.RequestException):
+        fetch.download_to_consumer(url, lambda chunk: None)
@@ -1,12 +1,22 @@
+import json
 import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch
 
+import numpy as np
+import pytest
+import requests
 import responses
 
-from hyp3lib import get_orb
+from hyp3lib import OrbitDownloadError, get_orb
 
 
 _GRANULE = 'S1A_IW_SLC__1SSV_20150621T120220_20150621T120232_006471_008934_72D8'
+_NEXT_GRANULE = 'S1A_IW_SLC__1SDV_20150622T120220_20150622T120232_006486_008981_8D3E'
+_UNCOVERED_GRANULE = 'S1A_IW_SLC__1SDV_20150624T120220_20150624T120232_006515_0089A5_1F2C'
 
 
 @responses.activate
@@ -44,6 +54,187 @@ def test_esa_token():
     assert delete_request.call_count == 1
 
 
+@responses.activate
+def test_esa_token_manager():
+    password_grant = responses.add(
+        responses.POST,
+        url=get_orb.ESA_CREATE_TOKEN_URL,
+        match=[
+            responses.matchers.urlencoded_params_matcher(
+                {
+                    'client_id': 'cdse-public',
+                    'grant_type': 'password',
+                    'username': 'myUsername',
+                    'password': 'myPassword',
+                }
+            )
+        ],
+        json={
+            'access_token': 'ABC123',
+            'refresh_token': 'myRefreshToken',
+            'session_state': 'mySessionId',
+            'expires_in': 600,
+            'refresh_expires_in': 3600,
+        },
+    )
+    refresh_grant = responses.add(
+        responses.POST,
+        url=get_orb.ESA_CREATE_TOKEN_URL,
+        match=[
+            responses.matchers.urlencoded_params_matcher(
+                {'client_id': 'cdse-public', 'grant_type': 'refresh_token', 'refresh_token': 'myRefreshToken'}
+            )
+        ],
+        json={
+            'access_token': 'DEF456',
+            'refresh_token': 'myRefreshToken',
+            'session_state': 'mySessionId',
+            'expires_in': 600,
+            'refresh_expires_in': 3600,
+        },
+    )
+    delete_request = responses.add(
+        responses.DELETE,
+        url=f'{get_orb.ESA_DELETE_TOKEN_URL}/mySessionId',
+        match=[responses.matchers.header_matcher({'Authorization': 'Bearer DEF456'})],
+    )
+
+    with get_orb.EsaTokenManager(username='myUsername', password='myPassword') as token_manager:
+        with patch('hyp3lib.get_orb.time.monotonic', return_value=1000.0):
+            assert token_manager.get_token() == 'ABC123'
+            assert token_manager.get_token() == 'ABC123'
+        assert password_grant.call_count == 1
+
+        with patch('hyp3lib.get_orb.time.monotonic', return_value=1550.0):
+            assert token_manager.get_token() == 'DEF456'
+        assert refresh_grant.call_count == 1
+        assert delete_request.call_count == 0
+
+    assert delete_request.call_count == 1
+    token_manager.close()
+    assert delete_request.call_count == 1
+
+
+def _token_response(access_token, session_id, expires_in=600, refresh_expires_in=3600):
+    return {
+        'access_token': access_token,
+        'refresh_token': f'{access_token}Refresh',
+        'session_state': session_id,
+        'expires_in': expires_in,
+        'refresh_expires_in': refresh_expires_in,
+    }
+
+
+@responses.activate
+def test_esa_token_manager_new_session():
+    password_matcher = responses.matchers.urlencoded_params_matcher(
+        {'client_id': 'cdse-public', 'grant_type': 'password', 'username': 'myUsername', 'password': 'myPassword'}
+    )
+    responses.add(
+        responses.POST,
+        url=get_orb.ESA_CREATE_TOKEN_URL,
+        match=[password_matcher],
+        json=_token_response('token1', 'sess1', refresh_expires_in=700),
+    )
+    responses.add(
+        responses.POST,
+        url=get_orb.ESA_CREATE_TOKEN_URL,
+        match=[password_matcher],
+        json=_token_response('token2', 'sess2'),
+    )
+    delete_sess1 = responses.add(
+        responses.DELETE,
+        url=f'{get_orb.ESA_DELETE_TOKEN_URL}/sess1',
+        match=[responses.matchers.header_matcher({'Authorization': 'Bearer token2'})],
+    )
+    refresh_sess2 = responses.add(
+        responses.POST,
+        url=get_orb.ESA_CREATE_TOKEN_URL,
+        match=[
+            responses.matchers.urlencoded_params_matcher(
+                {'client_id': 'cdse-public', 'grant_type': 'refresh_token', 'refresh_token': 'token2Refresh'}
+            )
+        ],
+        json=_token_response('token3', 'sess2'),
+    )
+    delete_sess2 = responses.add(
+        responses.DELETE,
+        url=f'{get_orb.ESA_DELETE_TOKEN_URL}/sess2',
+        match=[responses.matchers.header_matcher({'Authorization': 'Bearer token3'})],
+    )
+
+    token_manager = get_orb.EsaTokenManager(username='myUsername', password='myPassword')
+    with patch('hyp3lib.get_orb.time.monotonic', return_value=1000.0):
+        assert token_manager.get_token() == 'token1'
+
+    # The refresh token has expired, so a new session is created and the old one deleted
+    with patch('hyp3lib.get_orb.time.monotonic', return_value=1700.0):
+        assert token_manager.get_token() == 'token2'
+    assert delete_sess1.call_count == 1
+
+    # The access token has expired by the time the manager is closed, so it's refreshed first
+    with patch('hyp3lib.get_orb.time.monotonic', return_value=2500.0):
+        token_manager.close()
+    assert refresh_sess2.call_count == 1
+    assert delete_sess2.call_count == 1
+
+
+def test_get_esa_token_manager():
+    token_manager = get_orb.get_esa_token_manager('myUsername', 'myPassword')
+    assert get_orb.get_esa_token_manager('myUsername', 'myPassword') is token_manager
+    assert get_orb.get_esa_token_manager('otherUsername', 'myPassword') is not token_manager
+    get_orb._close_esa_token_managers()
+    assert get_orb.get_esa_token_manager('myUsername', 'myPassword') is not token_manager
+
+
+@responses.activate
+def test_close_esa_token_managers_timeout(caplog):
+    timeout_matcher = responses.matchers.request_kwargs_matcher({'timeout': get_orb.ESA_TOKEN_TIMEOUT})
+    responses.add(
+        responses.POST,
+        url=get_orb.ESA_CREATE_TOKEN_URL,
+        match=[timeout_matcher],
+        json=_token_response('token1', 'sess1', expires_in=0),
+    )
+    refresh_grant = responses.add(
+        responses.POST, url=get_orb.ESA_CREATE_TOKEN_URL, match=[timeout_matcher], body=requests.Timeout()
+    )
+
+    token_manager = get_orb.get_esa_token_manager('myUsername', 'myPassword')
+    assert token_manager.get_token() == 'token1'
+
+    get_orb._close_esa_token_managers()
+    assert refresh_grant.call_count == 1
+    assert 'Timed out deleting CDSE session for myUsername' in caplog.text
+
+
+@responses.activate
+def test_download_sentinel_orbit_file_esa_token_manager(tmp_path):
+    url_request = responses.add(
+        method=responses.GET,
+        url='https://foo.bar/hello.txt',
+        body='content',
+        match=[responses.matchers.header_matcher({'Authorization': 'Bearer test-token'})],
+    )
+    token_manager = get_orb.EsaTokenManager('user', 'pass')
+
+    with (
+        patch('hyp3lib.get_orb.get_orbit_url', return_value='https://foo.bar/hello.txt'),
+        patch.object(token_manager, 'get_token', return_value='test-token') as mock_get_token,
+    ):
+        for _ in range(2):
+            orbit_file, provider = get_orb.downloadSentinelOrbitFile(
+                _GRANULE, providers=('ESA',), directory=str(tmp_path), esa_token_manager=token_manager
+            )
+            assert (orbit_file, provider) == (str(tmp_path / 'hello.txt'), 'ESA')
+
+    assert mock_get_token.call_count == 2
+    assert url_request.call_count == 2
+
+    with pytest.raises(ValueError):
+        get_orb.downloadSentinelOrbitFile(_GRANULE, providers=('ESA',), directory=str(tmp_path))
+
+
 @responses.activate
 def test_download_sentinel_orbit_file_esa(tmp_path):
     url_request = responses.add(
@@ -112,3 +303,493 @@ def test_get_orbit_url_asf():
         'https://s1qc.asf.alaska.edu/aux_poeorb/'
         'S1A_OPER_AUX_POEORB_OPOD_20150711T121908_V20150620T225944_20150622T005944.EOF' == orbit_url
     )
+
+
+@responses.activate
+def test_get_orbit_url_asf_listing(test_data_folder):
+    responses.add(
+        responses.GET,
+        'https://s1qc.asf.alaska.edu/aux_poeorb/',
+        body=(test_data_folder / 's1qc_aux_poeorb.html').read_text(),
+    )
+    orbit_url = get_orb.get_orbit_url(_GRANULE, provider='ASF')
+    assert orbit_url == (
+        'https://s1qc.asf.alaska.edu/aux_poeorb/'
+        'S1A_OPER_AUX_POEORB_OPOD_20150711T121908_V20150620T225944_20150622T005944.EOF'
+    )
+
+
+def test_parse_orbit_validity():
+    assert get_orb._parse_orbit_validity(
+        'S1A_OPER_AUX_POEORB_OPOD_20150711T121908_V20150620T225944_20150622T005944.EOF'
+    ) == (1434841184, 1434934784)
+    assert get_orb._parse_orbit_validity('README.txt') is None
+
+
+@responses.activate
+def test_orbit_catalog(tmp_path, test_data_folder):
+    listing = responses.add(
+        responses.GET,
+        'https://s1qc.asf.alaska.edu/aux_poeorb/',
+        body=(test_data_folder / 's1qc_aux_poeorb.html').read_text(),
+    )
+    catalog_file = tmp_path / 'orbit_catalog.json'
+    catalog = get_orb.OrbitCatalog(catalog_file)
+
+    orbit_url = get_orb.get_orbit_url(_GRANULE, provider='ASF', catalog=catalog)
+    assert orbit_url == (
+        'https://s1qc.asf.alaska.edu/aux_poeorb/'
+        'S1A_OPER_AUX_POEORB_OPOD_20150711T121908_V20150620T225944_20150622T005944.EOF'
+    )
+    assert listing.call_count == 1
+    assert catalog_file.exists()
+
+    assert catalog.find('S1A', 'AUX_POEORB', datetime(2015, 6, 20, 12)) == (
+        'S1A_OPER_AUX_POEORB_OPOD_20150710T122034_V20150619T225944_20150621T005944.EOF'
+    )
+    assert catalog.find('S1A', 'AUX_POEORB', datetime(2015, 6, 22, 12)) == (
+        'S1A_OPER_AUX_POEORB_OPOD_20150712T122206_V20150621T225944_20150623T005944.EOF'
+    )
+    assert catalog.find('S1B', 'AUX_POEORB', datetime(2016, 12, 12)) is None
+    assert catalog.find('S1A', 'AUX_POEORB', datetime(2015, 6, 24)) is None
+    assert catalog.find('S1A', 'AUX_RESORB', datetime(2015, 6, 21)) is None
+    timestamps = [datetime(2015, 6, 20, 12), datetime(2015, 6, 21, 12, 2, 20), datetime(2015, 6, 24)]
+    assert catalog.find_many('S1A', 'AUX_POEORB', timestamps) == [
+        catalog.find('S1A', 'AUX_POEORB', timestamp) for timestamp in timestamps
+    ]
+
+    offline_catalog = get_orb.OrbitCatalog(catalog_file, offline=True)
+    assert get_orb.get_orbit_url(_GRANULE, provider='ASF', catalog=offline_catalog) == orbit_url
+    assert offline_catalog.get_orbit_url('S1A', 'AUX_POEORB', datetime(2015, 6, 24)) is None
+    assert listing.call_count == 1
+
+    with patch('hyp3lib.get_orb._list_asf_orbit_files', wraps=get_orb._list_asf_orbit_files) as mock_list:
+        assert catalog.get_orbit_url('S1A', 'AUX_POEORB', datetime(2015, 6, 24), timeout=5) is None
+        assert get_orb.get_orbit_urls(
+            ['S1A_IW_SLC__1SDV_20150624T000000_20150624T000010_0_0_0000'], provider='ASF', catalog=catalog, timeout=5
+        ) == {'S1A_IW_SLC__1SDV_20150624T000000_20150624T000010_0_0_0000': None}
+    assert mock_list.call_args_list == [
+        (('AUX_POEORB', 'S1A'), {'timeout': 5}),
+        (('AUX_POEORB', 'S1A'), {'timeout': 5}),
+    ]
+    assert listing.call_count == 3
+
+
+def test_orbit_catalog_add(tmp_path):
+    catalog = get_orb.OrbitCatalog(tmp_path / 'orbit_catalog.json')
+    orbit_files = [
+        'S1A_OPER_AUX_RESORB_OPOD_20150621T150000_V20150621T110000_20150621T141000.EOF',
+        'S1A_OPER_AUX_RESORB_OPOD_20150621T140000_V20150621T100000_20150621T131000.EOF',
+    ]
+    assert catalog.add('S1A', 'AUX_RESORB', orbit_files) == 2
+    assert catalog.add('S1A', 'AUX_RESORB', orbit_files) == 0
+    assert catalog.find('S1A', 'AUX_RESORB', datetime(2015, 6, 21, 10, 30)) == orbit_files[1]
+    assert catalog.find('S1A', 'AUX_RESORB', datetime(2015, 6, 21, 13, 30)) == orbit_files[0]
+    assert catalog.find('S1A', 'AUX_RESORB', datetime(2015, 6, 21, 12, 0)) == orbit_files[1]
+
+    new_orbit_file = 'S1A_OPER_AUX_RESORB_OPOD_20150621T170000_V20150621T130000_20150621T161000.EOF'
+    assert catalog.add('S1A', 'AUX_RESORB', [*orbit_files, new_orbit_file, 'README.txt']) == 1
+    assert catalog.find('S1A', 'AUX_RESORB', datetime(2015, 6, 21, 15, 0)) == new_orbit_file
+
+    catalog.save()
+    assert (
+        get_orb.OrbitCatalog(tmp_path / 'orbit_catalog.json').find('S1A', 'AUX_RESORB', datetime(2015, 6, 21, 15, 0))
+        == new_orbit_file
+    )
+
+
+def test_select_orbit_files():
+    starts = np.array([0, 10, 20, 30])
+    ends = np.array([25, 35, 45, 40])
+    preference = np.array([0, 1, 3, 2])
+
+    selected = get_orb._select_orbit_files(
+        starts,
+        ends,
+        preference,
+        granule_starts=np.array([5, 22, 31, 36, 50]),
+        granule_ends=np.array([8, 24, 34, 42, 55]),
+    )
+    assert selected.tolist() == [0, 2, 2, 2, -1]
+
+    selected = get_orb._select_orbit_files(
+        starts, ends, np.array([0, 1, 2, 3]), granule_starts=np.array([31]), granule_ends=np.array([34])
+    )
+    assert selected.tolist() == [3]
+
+    empty = np.array([], dtype=np.int64)
+    assert get_orb._select_orbit_files(empty, empty, empty, np.array([5]), np.array([8])).tolist() == [-1]
+
+
+@responses.activate
+def test_get_orbit_urls_esa():
+    responses.add(
+        responses.GET,
+        get_orb.ESA_SEARCH_URL,
+        match=[
+            responses.matchers.query_param_matcher(
+                {
+                    '$filter': "Collection/Name eq 'SENTINEL-1' and "
+                    "startswith(Name, 'S1A_OPER_AUX_POEORB_OPOD_') and "
+                    'ContentDate/Start lt 2015-06-24T12:02:32Z and '
+                    'ContentDate/End gt 2015-06-21T12:02:20Z',
+                    '$orderby': 'ContentDate/Start asc',
+                    '$top': '1000',
+                }
+            )
+        ],
+        json={
+            'value': [
+                {
+                    'Id': 'secondId',
+                    'Name': 'S1A_OPER_AUX_POEORB_OPOD_20150712T122206_V20150621T225944_20150623T005944.EOF',
+                    'ContentDate': {'Start': '2015-06-21T22:59:44.000Z', 'End': '2015-06-23T00:59:44.000Z'},
+                },
+                {
+                    'Id': 'firstId',
+                    'Name': 'S1A_OPER_AUX_POEORB_OPOD_20150711T121908_V20150620T225944_20150622T005944.EOF',
+                    'ContentDate': {'Start': '2015-06-20T22:59:44.000Z', 'End': '2015-06-22T00:59:44.000Z'},
+                },
+                {
+                    'Id': 'reprocessedFirstId',
+                    'Name': 'S1A_OPER_AUX_POEORB_OPOD_20210301T000000_V20150620T225944_20150622T005944.EOF',
+                    'ContentDate': {'Start': '2015-06-20T22:59:44.000Z', 'End': '2015-06-22T00:59:44.000Z'},
+                },
+            ]
+        },
+    )
+
+    orbit_urls = get_orb.get_orbit_urls([_GRANULE, _NEXT_GRANULE, _UNCOVERED_GRANULE, _GRANULE], provider='ESA')
+    assert orbit_urls == {
+        _GRANULE: f'{get_orb.ESA_DOWNLOAD_URL}/reprocessedFirstId',
+        _NEXT_GRANULE: f'{get_orb.ESA_DOWNLOAD_URL}/secondId',
+        _UNCOVERED_GRANULE: None,
+    }
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_list_esa_orbit_products_pages():
+    search_filter = (
+        "Collection/Name eq 'SENTINEL-1' and "
+        "startswith(Name, 'S1A_OPER_AUX_POEORB_OPOD_') and "
+        'ContentDate/Start lt 2015-06-24T00:00:00Z and '
+        'ContentDate/End gt 2015-06-20T00:00:00Z'
+    )
+    products = [
+        {'Id': f'id{day}', 'ContentDate': {'Start': f'2015-06-{day}T22:59:44.000Z'}} for day in (20, 21, 22, 23)
+    ]
+    for page_filter, page in [
+        (search_filter, products[0:2]),
+        (f'{search_filter} and ContentDate/Start ge 2015-06-21T22:59:44.000Z', products[1:3]),
+        (f'{search_filter} and ContentDate/Start ge 2015-06-22T22:59:44.000Z', products[2:4]),
+        (f'{search_filter} and ContentDate/Start ge 2015-06-23T22:59:44.000Z', products[3:4]),
+    ]:
+        responses.add(
+            responses.GET,
+            get_orb.ESA_SEARCH_URL,
+            match=[
+                responses.matchers.query_param_matcher(
+                    {'$filter': page_filter, '$orderby': 'ContentDate/Start asc', '$top': '2'}
+                )
+            ],
+            json={'value': page},
+        )
+
+    assert (
+        get_orb._list_esa_orbit_products(
+            'AUX_POEORB', 'S1A', datetime(2015, 6, 20), datetime(2015, 6, 24), page_size=2, timeout=5
+        )
+        == products
+    )
+    assert len(responses.calls) == 4
+    assert all('skip' not in str(call.request.url) for call in responses.calls)
+
+
+@responses.activate
+def test_get_orbit_urls_asf(tmp_path, test_data_folder):
+    listing = responses.add(
+        responses.GET,
+        'https://s1qc.asf.alaska.edu/aux_poeorb/',
+        body=(test_data_folder / 's1qc_aux_poeorb.html').read_text(),
+    )
+    expected = {
+        _GRANULE: 'https://s1qc.asf.alaska.edu/aux_poeorb/'
+        'S1A_OPER_AUX_POEORB_OPOD_20150711T121908_V20150620T225944_20150622T005944.EOF',
+        _NEXT_GRANULE: 'https://s1qc.asf.alaska.edu/aux_poeorb/'
+        'S1A_OPER_AUX_POEORB_OPOD_20150712T122206_V20150621T225944_20150623T005944.EOF',
+        _UNCOVERED_GRANULE: None,
+    }
+
+    assert get_orb.get_orbit_urls([_GRANULE, _NEXT_GRANULE, _UNCOVERED_GRANULE], provider='ASF') == expected
+    assert listing.call_count == 1
+
+    catalog = get_orb.OrbitCatalog(tmp_path / 'orbit_catalog.json')
+    granules = [_GRANULE, _NEXT_GRANULE, _UNCOVERED_GRANULE]
+    assert get_orb.get_orbit_urls(granules, provider='ASF', catalog=catalog) == expected
+    assert listing.call_count == 2
+
+    with pytest.raises(OrbitDownloadError):
+        get_orb.get_orbit_urls([_GRANULE], provider='foo')
+
+
+@responses.activate
+def test_download_sentinel_orbit_files(tmp_path):
+    responses.add(responses.GET, 'https://foo.bar/poeorb.EOF', body='poeorb')
+    responses.add(responses.GET, 'https://foo.bar/resorb.EOF', body='resorb')
+
+    def get_orbit_urls(granules, orbit_type, provider, catalog, timeout):
+        if provider == 'ESA':
+            raise requests.RequestException()
+        if orbit_type == 'AUX_POEORB':
+            return {
+                granule: 'https://foo.bar/poeorb.EOF' if granule != _UNCOVERED_GRANULE else None for granule in granules
+            }
+        return {granule: 'https://foo.bar/resorb.EOF' for granule in granules}
+
+    with (
+        patch('hyp3lib.get_orb.get_orbit_urls', side_effect=get_orbit_urls),
+        patch('hyp3lib.get_orb.EsaToken.__enter__', return_value='test-token'),
+        patch('hyp3lib.get_orb.EsaToken.__exit__'),
+    ):
+        results = get_orb.downloadSentinelOrbitFiles(
+            [_GRANULE, _NEXT_GRANULE, _UNCOVERED_GRANULE], directory=str(tmp_path), esa_credentials=('user', 'pass')
+        )
+
+    assert results == {
+        _GRANULE: (str(tmp_path / 'poeorb.EOF'), 'ASF'),
+        _NEXT_GRANULE: (str(tmp_path / 'poeorb.EOF'), 'ASF'),
+        _UNCOVERED_GRANULE: (str(tmp_path / 'resorb.EOF'), 'ASF'),
+    }
+    assert len(responses.calls) == 2
+
+    with patch('hyp3lib.get_orb.get_orbit_urls', return_value={_GRANULE: None}):
+        results = get_orb.downloadSentinelOrbitFiles([_GRANULE], directory=str(tmp_path), providers=('ASF',))
+    assert isinstance(results[_GRANULE], OrbitDownloadError)
+
+
+_ORBIT_FILE = 'S1A_OPER_AUX_POEORB_OPOD_20150711T121908_V20150620T225944_20150622T005944.EOF'
+
+
+def test_orbit_file_cache(tmp_path):
+    cache = get_orb.OrbitFileCache(tmp_path / 'cache', max_files=2)
+    start_time, end_time = datetime(2015, 6, 21, 12, 2, 20), datetime(2015, 6, 21, 12, 2, 32)
+    assert cache.find('S1A', 'AUX_POEORB', start_time, end_time) is None
+
+    orbit_file = tmp_path / _ORBIT_FILE
+    orbit_file.write_text('orbit')
+    cached_file = cache.add(orbit_file)
+    assert cached_file == tmp_path / 'cache' / _ORBIT_FILE
+    assert cached_file.read_text() == 'orbit'
+    assert cache.find('S1A', 'AUX_POEORB', start_time, end_time) == cached_file
+    assert cache.find('S1A', 'AUX_RESORB', start_time, end_time) is None
+    assert cache.find('S1B', 'AUX_POEORB', start_time, end_time) is None
+    assert cache.find('S1A', 'AUX_POEORB', datetime(2015, 6, 22, 12), datetime(2015, 6, 22, 12, 1)) is None
+
+    assert cache.add(tmp_path / 'README.txt') is None
+
+    for name in [
+        'S1A_OPER_AUX_POEORB_OPOD_20210301T000000_V20150620T225944_20150622T005944.EOF',
+        'S1A_OPER_AUX_POEORB_OPOD_20150712T122206_V20150621T225944_20150623T005944.EOF',
+    ]:
+        (tmp_path / name).write_text('orbit')
+        os.utime(cached_file, (0, 0))
+        cache.add(tmp_path / name)
+
+    assert sorted(path.name for path in (tmp_path / 'cache').iterdir()) == [
+        'S1A_OPER_AUX_POEORB_OPOD_20150712T122206_V20150621T225944_20150623T005944.EOF',
+        'S1A_OPER_AUX_POEORB_OPOD_20210301T000000_V20150620T225944_20150622T005944.EOF',
+    ]
+    assert cache.find('S1A', 'AUX_POEORB', start_time, end_time) == (
+        tmp_path / 'cache' / 'S1A_OPER_AUX_POEORB_OPOD_20210301T000000_V20150620T225944_20150622T005944.EOF'
+    )
+
+
+@responses.activate
+def test_download_sentinel_orbit_file_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('HYP3LIB_ORBIT_CACHE_DIR', str(tmp_path / 'cache'))
+    url_request = responses.add(responses.GET, f'https://foo.bar/{_ORBIT_FILE}', body='orbit')
+    (tmp_path / 'first').mkdir()
+    (tmp_path / 'second').mkdir()
+
+    with patch('hyp3lib.get_orb.get_orbit_url', return_value=f'https://foo.bar/{_ORBIT_FILE}') as mock_get_orbit_url:
+        orbit_file, provider = get_orb.downloadSentinelOrbitFile(
+            _GRANULE, directory=str(tmp_path / 'first'), providers=('ASF',)
+        )
+        assert (orbit_file, provider) == (str(tmp_path / 'first' / _ORBIT_FILE), 'ASF')
+        assert (tmp_path / 'cache' / _ORBIT_FILE).read_text() == 'orbit'
+
+        orbit_file, provider = get_orb.downloadSentinelOrbitFile(
+            _GRANULE, directory=str(tmp_path / 'second'), providers=('ASF',)
+        )
+        assert (orbit_file, provider) == (str(tmp_path / 'second' / _ORBIT_FILE), 'cache')
+        assert (tmp_path / 'second' / _ORBIT_FILE).read_text() == 'orbit'
+
+        results = get_orb.downloadSentinelOrbitFiles([_GRANULE], directory=str(tmp_path / 'second'), providers=('ASF',))
+        assert results == {_GRANULE: (str(tmp_path / 'second' / _ORBIT_FILE), 'cache')}
+
+    assert mock_get_orbit_url.call_count == 1
+    assert url_request.call_count == 1
+
+
+@pytest.fixture
+def orbit_provider_server(monkeypatch, test_data_folder):
+    listing = (test_data_folder / 's1qc_aux_poeorb.html').read_bytes()
+    delays = {'ESA': 0.0, 'ASF': 0.0}
+    requested_paths: list[str] = []
+    release = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requested_paths.append(self.path)
+            if self.path.startswith('/odata'):
+                release.wait(delays['ESA'])
+                body = json.dumps({'value': [{'Id': 'esaId'}]}).encode()
+            elif self.path == '/aux_poeorb/':
+                release.wait(delays['ASF'])
+                body = listing
+            else:
+                body = b'orbit'
+            try:
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    monkeypatch.setattr(get_orb, 'ESA_SEARCH_URL', f'{base_url}/odata')
+    monkeypatch.setattr(get_orb, 'ESA_DOWNLOAD_URL', f'{base_url}/download')
+    monkeypatch.setattr(get_orb, 'ASF_ORBIT_URL', base_url)
+    yield delays, requested_paths
+    release.set()
+    server.shutdown()
+    thread.join()
+
+
+def test_download_sentinel_orbit_file_race_slow_provider(tmp_path, orbit_provider_server):
+    delays, requested_paths = orbit_provider_server
+    delays['ESA'] = 30.0
+
+    start = time.monotonic()
+    with (
+        patch('hyp3lib.get_orb.EsaToken.__enter__', return_value='test-token'),
+        patch('hyp3lib.get_orb.EsaToken.__exit__'),
+    ):
+        orbit_file, provider = get_orb.downloadSentinelOrbitFile(
+            _GRANULE,
+            directory=str(tmp_path),
+            esa_credentials=('user', 'pass'),
+            race_providers=True,
+            timeout=1.0,
+        )
+
+    assert time.monotonic() - start < 10
+    assert (orbit_file, provider) == (str(tmp_path / _ORBIT_FILE), 'ASF')
+    assert f'/aux_poeorb/{_ORBIT_FILE}' in requested_paths
+    assert '/download/esaId' not in requested_paths
+
+
+def test_download_sentinel_orbit_file_race_preference(tmp_path, orbit_provider_server):
+    delays, requested_paths = orbit_provider_server
+    delays['ESA'] = 0.5
+
+    with (
+        patch('hyp3lib.get_orb.EsaToken.__enter__', return_value='test-token'),
+        patch('hyp3lib.get_orb.EsaToken.__exit__'),
+    ):
+        orbit_file, provider = get_orb.downloadSentinelOrbitFile(
+            _GRANULE,
+            directory=str(tmp_path),
+            esa_credentials=('user', 'pass'),
+            race_providers=True,
+            timeout=10.0,
+        )
+
+    assert (orbit_file, provider) == (str(tmp_path / 'esaId'), 'ESA')
+    assert '/aux_poeorb/' in requested_paths
+    assert requested_paths[-1] == '/download/esaId'
+    assert not any(path.endswith('.EOF') for path in requested_paths)
+
+
+def test_download_sentinel_orbit_file_race_cache_hit(tmp_path, orbit_provider_server):
+    _, requested_paths = orbit_provider_server
+    cache = get_orb.OrbitFileCache(tmp_path / 'cache')
+    (tmp_path / _ORBIT_FILE).write_text('orbit')
+    cache.add(tmp_path / _ORBIT_FILE)
+    (tmp_path / 'output').mkdir()
+
+    with patch('hyp3lib.get_orb._OrbitUrlRace') as mock_race:
+        orbit_file, provider = get_orb.downloadSentinelOrbitFile(
+            _GRANULE,
+            directory=str(tmp_path / 'output'),
+            esa_credentials=('user', 'pass'),
+            cache=cache,
+            race_providers=True,
+        )
+
+    assert (orbit_file, provider) == (str(tmp_path / 'output' / _ORBIT_FILE), 'cache')
+    mock_race.assert_not_called()
+    assert requested_paths == []
+
+
+def test_download_sentinel_orbit_file_race_default_timeout(tmp_path, orbit_provider_server, monkeypatch):
+    delays, requested_paths = orbit_provider_server
+    delays['ESA'] = 30.0
+    monkeypatch.setattr(get_orb, 'DEFAULT_ORBIT_RACE_TIMEOUT', 1.0)
+
+    start = time.monotonic()
+    with (
+        patch('hyp3lib.get_orb.EsaToken.__enter__', return_value='test-token'),
+        patch('hyp3lib.get_orb.EsaToken.__exit__'),
+    ):
+        orbit_file, provider = get_orb.downloadSentinelOrbitFile(
+            _GRANULE,
+            directory=str(tmp_path),
+            esa_credentials=('user', 'pass'),
+            race_providers=True,
+        )
+
+    assert time.monotonic() - start < 10
+    assert (orbit_file, provider) == (str(tmp_path / _ORBIT_FILE), 'ASF')
+
+
+def test_download_sentinel_orbit_file_race_provider_timeouts(tmp_path, orbit_provider_server):
+    delays, requested_paths = orbit_provider_server
+    delays['ESA'] = 30.0
+
+    start = time.monotonic()
+    with (
+        patch('hyp3lib.get_orb.EsaToken.__enter__', return_value='test-token'),
+        patch('hyp3lib.get_orb.EsaToken.__exit__'),
+    ):
+        orbit_file, provider = get_orb.downloadSentinelOrbitFile(
+            _GRANULE,
+            directory=str(tmp_path),
+            esa_credentials=('user', 'pass'),
+            race_providers=True,
+            timeout={'esa': 1.0, 'ASF': 20.0},
+        )
+
+    assert time.monotonic() - start < 10
+    assert (orbit_file, provider) == (str(tmp_path / _ORBIT_FILE), 'ASF')
+
+
+def test_orbit_url_race_lookup_timeouts(tmp_path):
+    catalog = get_orb.OrbitCatalog(tmp_path / 'orbit_catalog.json', offline=True)
+    with patch('hyp3lib.get_orb.get_orbit_url', return_value=None) as mock_get_orbit_url:
+        race = get_orb._OrbitUrlRace(_GRANULE, ['AUX_POEORB'], ['ESA', 'ASF'], catalog, timeout={'ESA': 5.0})
+        assert race.result('AUX_POEORB', 'ESA') is None
+        assert race.result('AUX_POEORB', 'ASF') is None
+        race.close()
+
+    timeouts = {call.kwargs['provider']: call.kwargs['timeout'] for call in mock_get_orbit_url.call_args_list}
+    assert timeouts == {'ESA': 5.0, 'ASF': get_orb.DEFAULT_ORBIT_RACE_TIMEOUT}
+    assert all(call.kwargs['catalog'] is catalog for call in mock_get_orbit_url.call_args_list)
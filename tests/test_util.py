@@ -34,3 +34,14 @@ def test_string_is_true():
     assert not util.string_is_true(' ')
     assert not util.string_is_true('true1')
     assert not util.string_is_true('false')
+
+
+def test_get_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv('HYP3LIB_CACHE_DIR', raising=False)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'xdg'))
+    assert util.get_cache_dir('dem') == tmp_path / 'xdg' / 'hyp3lib' / 'dem'
+    assert (tmp_path / 'xdg' / 'hyp3lib' / 'dem').is_dir()
+
+    monkeypatch.setenv('HYP3LIB_CACHE_DIR', str(tmp_path / 'cache'))
+    assert util.get_cache_dir('orbits') == tmp_path / 'cache' / 'orbits'
+    assert (tmp_path / 'cache' / 'orbits').is_dir()